@@ -0,0 +1,68 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import argparse
+from benchmarks.synthetic import synthetic_facts
+import json
+import pandas as pd
+from src.storage import CATEGORICAL_COLUMNS, COLUMNS, CsvStorage
+import statistics
+import tempfile
+import time
+
+
+FILTERS = [{"categories": ["work"]}, {"categories": ["Work", "Home", "Family"], "entry_types": ["note", "list"]},
+           {"people": ["mom", "dad"]}]
+
+
+def object_filter(df, categories=None, entry_types=None, people=None):
+    """
+    The filter as done before the categorical columns: lowercasing every row of each filtered column.
+    """
+    for column, values in [("Category", categories), ("Type", entry_types), ("People", people)]:
+        if values is not None and len(values) > 0:
+            df = df[df[column].str.lower().isin([v.lower() for v in values])]
+    return df
+
+
+def median_time(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reports the memory and filter latency of the categorical columns.")
+    parser.add_argument("--size", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        df_object = pd.DataFrame(synthetic_facts(args.size), columns=COLUMNS)
+        df_object.to_csv(os.path.join(directory, "db.csv"), index=False)
+        df_object = pd.read_csv(os.path.join(directory, "db.csv"))
+        storage = CsvStorage(os.path.join(directory, "db.csv"), os.path.join(directory, "categories.csv"),
+                             os.path.join(directory, "journal.csv"))
+        df_categorical = storage.dataframe()
+
+        report = {"facts": args.size, "memory_bytes": {}, "filter_ms": []}
+        for column in CATEGORICAL_COLUMNS:
+            report["memory_bytes"][column] = {"object": int(df_object[column].memory_usage(deep=True, index=False)),
+                                              "categorical": int(df_categorical[column].memory_usage(deep=True, index=False))}
+        report["memory_bytes"]["total"] = {"object": int(df_object.memory_usage(deep=True).sum()),
+                                           "categorical": int(df_categorical.memory_usage(deep=True).sum())}
+
+        for filters in FILTERS:
+            report["filter_ms"].append({"filters": filters,
+                                        "object": median_time(lambda: object_filter(df_object, **filters), args.repeat) * 1000,
+                                        "categorical": median_time(lambda: storage.filtered(**filters), args.repeat) * 1000})
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
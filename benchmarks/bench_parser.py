@@ -0,0 +1,50 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import argparse
+import ast
+from benchmarks.synthetic import synthetic_facts
+import json
+from src.engine import Postprocessor
+import statistics
+import time
+
+
+def completion_text(n):
+    """
+    Builds a completion with `n` fact tuples, one per line, as returned by the extraction prompt.
+    """
+    return "\n".join(f'("{c}", "{t}", "{p}", "{k}", "{v}")' for c, t, p, k, v in synthetic_facts(n))
+
+
+def median_time(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the fact tuple parser with eval and ast.literal_eval.")
+    parser.add_argument("--lines", type=int, nargs="+", default=[100, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    postprocessor = Postprocessor()
+    report = []
+    for n in args.lines:
+        text = completion_text(n)
+        lines = [line.strip() for line in postprocessor.extract_lines_from_result(text)]
+        assert postprocessor.parse_tuples(text)[0] == [eval(line) for line in lines]
+        report.append({"lines": n,
+                       "eval_ms": median_time(lambda: [eval(line) for line in lines], args.repeat) * 1000,
+                       "literal_eval_ms": median_time(lambda: [ast.literal_eval(line) for line in lines], args.repeat) * 1000,
+                       "parse_tuples_ms": median_time(lambda: postprocessor.parse_tuples(text), args.repeat) * 1000})
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import argparse
+from benchmarks.synthetic import synthetic_facts
+import pandas as pd
+from src.storage import COLUMNS, CsvStorage
+import statistics
+import tempfile
+import time
+
+
+QUERIES = [["aspirin"], ["phone", "number"], ["flight", "hotel", "passport"], ["mom"], ["nothing matches this"]]
+
+
+def regex_search(df, terms):
+    """
+    The search as done before the term index: a regex scan of every column, concatenated.
+    """
+    df = df.fillna("")
+    df_results = None
+    for column in df.columns:
+        df_result = df[df[column].str.contains("|".join(terms), case=False).fillna(False)]
+        df_results = df_result if df_results is None else pd.concat([df_results, df_result])
+    return df_results
+
+
+def timed(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the term index search with the regex scan.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print("facts,query,regex_ms,regex_rows,index_ms,index_rows")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            pd.DataFrame(synthetic_facts(size), columns=COLUMNS).to_csv(os.path.join(directory, "db.csv"), index=False)
+            storage = CsvStorage(os.path.join(directory, "db.csv"), os.path.join(directory, "categories.csv"),
+                                 os.path.join(directory, "journal.csv"))
+
+            start = time.perf_counter()
+            storage.term_index()
+            print(f"# {size} facts: term index built in {(time.perf_counter() - start) * 1000:.0f} ms", file=sys.stderr)
+
+            for terms in QUERIES:
+                regex_time, regex_result = timed(lambda: regex_search(storage.dataframe(), terms), args.repeat)
+                index_time, index_result = timed(lambda: storage.search(terms), args.repeat)
+                print(f"{size},{'|'.join(terms)},{regex_time * 1000:.2f},{len(regex_result)},"
+                      f"{index_time * 1000:.2f},{len(index_result)}")
+
+
+if __name__ == '__main__':
+    main()
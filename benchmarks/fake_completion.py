@@ -0,0 +1,122 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import asyncio
+from contextlib import contextmanager
+import openai
+import re
+import threading
+import time
+
+
+# --------------------------------------------------------------------------------
+# Class FakeCompletion
+# --------------------------------------------------------------------------------
+class FakeCompletion:
+    """
+    Local stand-in for `openai.Completion`, answering the prompts of the engine with canned
+    outputs after a configurable latency, so that the engine can be measured without an API key.
+    """
+    def __init__(self, latency_seconds=0.0, seconds_per_token=0.0, facts_per_utterance=3, synonyms_per_term=3):
+        self.latency_seconds = latency_seconds
+        self.seconds_per_token = seconds_per_token
+        self.facts_per_utterance = facts_per_utterance
+        self.synonyms_per_term = synonyms_per_term
+        self.requests = 0
+        self.prompts = 0
+        self._lock = threading.Lock()
+
+    def complete(self, prompt):
+        """
+        Returns the canned completion of a prompt of the engine.
+
+        Parameters:
+            prompt (str): The prompt, as built by the engine's preprocessor.
+
+        Returns:
+            str: A completion in the format the prompt asks for.
+        """
+        if "List some synonyms" in prompt:
+            term = re.search(r'term: "(.*)"', prompt).group(1)
+            return "\n" + "\n".join(f"{term} synonym {i}" for i in range(self.synonyms_per_term))
+
+        if "Extract the main entities" in prompt:
+            query = re.search(r'sentence: "(.*)"', prompt, re.DOTALL).group(1)
+            return "\n" + "\n".join(query.split())
+
+        utterance = prompt.rsplit("Input: ", 1)[-1].split("\nOutput:")[0].replace('"', "'")
+        return "\n".join(f'("Other", "Note", "Self", "fact {i}", "{utterance}")' for i in range(self.facts_per_utterance))
+
+    def create(self, prompt, stream=False, max_tokens=200, **kwargs):
+        """
+        Mimics `openai.Completion.create` for a prompt or a list of prompts, optionally streamed.
+        """
+        texts, response = self._respond(prompt)
+        if stream:
+            return self._stream(texts[0])
+
+        time.sleep(self._latency(texts))
+        return response
+
+    async def acreate(self, prompt, stream=False, max_tokens=200, **kwargs):
+        """
+        Mimics `openai.Completion.acreate`, waiting without blocking the event loop.
+        """
+        texts, response = self._respond(prompt)
+        if stream:
+            return self._astream(texts[0])
+
+        await asyncio.sleep(self._latency(texts))
+        return response
+
+    def _respond(self, prompt):
+        """
+        Counts a request and builds its response.
+
+        Returns:
+            tuple: The completion texts of the prompts, and the response of a non-streamed request.
+        """
+        prompts = prompt if isinstance(prompt, list) else [prompt]
+        with self._lock:
+            self.requests += 1
+            self.prompts += len(prompts)
+
+        texts = [self.complete(p) for p in prompts]
+        usage = {"prompt_tokens": sum(len(p) // 4 for p in prompts),
+                 "completion_tokens": sum(len(text) // 4 for text in texts)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        return texts, {"choices": [{"text": text, "index": i, "finish_reason": "stop"} for i, text in enumerate(texts)],
+                       "usage": usage}
+
+    def _latency(self, texts):
+        return self.latency_seconds + self.seconds_per_token * max(len(text) // 4 for text in texts)
+
+    def _stream(self, text):
+        time.sleep(self.latency_seconds)
+        for line in text.splitlines(keepends=True):
+            time.sleep(self.seconds_per_token * (len(line) // 4))
+            yield {"choices": [{"text": line, "index": 0, "finish_reason": None}]}
+
+    async def _astream(self, text):
+        await asyncio.sleep(self.latency_seconds)
+        for line in text.splitlines(keepends=True):
+            await asyncio.sleep(self.seconds_per_token * (len(line) // 4))
+            yield {"choices": [{"text": line, "index": 0, "finish_reason": None}]}
+
+
+@contextmanager
+def patched_completion(fake_completion):
+    """
+    Replaces `openai.Completion.create` and `openai.Completion.acreate` with a fake completion within 
+    a `with` block.
+
+    Parameters:
+        fake_completion (FakeCompletion): The fake to use.
+    """
+    original_create, original_acreate = openai.Completion.create, openai.Completion.acreate
+    openai.Completion.create, openai.Completion.acreate = fake_completion.create, fake_completion.acreate
+    try:
+        yield fake_completion
+    finally:
+        openai.Completion.create, openai.Completion.acreate = original_create, original_acreate
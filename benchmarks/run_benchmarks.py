@@ -0,0 +1,148 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import argparse
+from benchmarks.fake_completion import FakeCompletion, patched_completion
+from benchmarks.synthetic import synthetic_facts
+import json
+import pandas as pd
+import platform
+import statistics
+import subprocess
+from src.engine import Engine
+from src.storage import COLUMNS, SqliteStorage
+import tempfile
+import time
+
+
+QUERIES = ["aspirin", "phone number of mom", "flight hotel passport insurance"]
+UTTERANCES = [f"note number {i}: buy milk and bread, call the dentist" for i in range(1000)]
+
+
+def timed(timings, name, function):
+    """
+    Wraps a function so that the durations of its calls are appended to `timings[name]`.
+    """
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timings.setdefault(name, []).append(time.perf_counter() - start)
+    return wrapper
+
+
+def summary(durations):
+    """
+    Summarizes durations, in milliseconds.
+    """
+    durations = sorted(durations)
+    return {"count": len(durations),
+            "median_ms": statistics.median(durations) * 1000,
+            "p95_ms": durations[min(len(durations) - 1, int(0.95 * len(durations)))] * 1000,
+            "total_ms": sum(durations) * 1000}
+
+
+def create_database(directory, size, backend):
+    """
+    Creates a database of synthetic facts in a directory, and returns the engine arguments to open it.
+    """
+    paths = {"database_file_path": os.path.join(directory, "database.csv"),
+             "categories_file_path": os.path.join(directory, "categories.csv"),
+             "journal_file_path": os.path.join(directory, "journal.csv"),
+             "sqlite_file_path": os.path.join(directory, "database.sqlite"),
+             "vectors_file_path": os.path.join(directory, "vectors.bin")}
+    if backend == "csv":
+        pd.DataFrame(synthetic_facts(size), columns=COLUMNS).to_csv(paths["database_file_path"], index=False)
+    else:
+        SqliteStorage(paths["sqlite_file_path"]).insert(synthetic_facts(size))
+    return {**paths, "storage_backend": backend, "api_key": "benchmark", "use_completion_cache": False,
+            # send every query through the terms extraction prompt, to measure the LLM path
+            "local_terms_max_words": 0}
+
+
+def benchmark_size(size, backend, fake_completion, repeat, extractions):
+    with tempfile.TemporaryDirectory() as directory:
+        engine_arguments = create_database(directory, size, backend)
+        result = {"facts": size, "backend": backend}
+
+        start = time.perf_counter()
+        engine = Engine(**engine_arguments)
+        result["startup_ms"] = (time.perf_counter() - start) * 1000
+
+        timings = {}
+        engine._extract_terms = timed(timings, "llm", engine._extract_terms)
+        engine._augment_terms = timed(timings, "llm", engine._augment_terms)
+        engine._search_dataframe = timed(timings, "search", engine._search_dataframe)
+        engine._database_filtered_by = timed(timings, "filter", engine._database_filtered_by)
+        engine._save = timed(timings, "save", engine._save)
+        engine.commit = timed(timings, "commit", engine.commit)
+
+        # extraction, one utterance per request and batched
+        start = time.perf_counter()
+        for utterance in UTTERANCES[:extractions]:
+            engine.extract_facts(utterance)
+        result["extract_facts_per_second"] = extractions / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        engine.extract_facts_many(UTTERANCES[:extractions])
+        result["extract_facts_many_per_second"] = extractions / (time.perf_counter() - start)
+
+        # commits of one utterance at a time
+        for utterance in UTTERANCES[:repeat]:
+            engine.extract_facts(utterance)
+            engine.commit()
+
+        # queries, with and without search terms
+        query_durations = []
+        for _ in range(repeat):
+            for fact_query in QUERIES:
+                start = time.perf_counter()
+                engine.query(fact_query, limit=50)
+                query_durations.append(time.perf_counter() - start)
+            engine.query("", categories=["Work", "Home"], entry_types=["Note"], limit=50)
+
+        result["query"] = summary(query_durations)
+        result["stages"] = {name: summary(durations) for name, durations in timings.items()}
+        result["api"] = {"requests": fake_completion.requests, "prompts": fake_completion.prompts}
+        result["metrics"] = engine.metrics.snapshot()
+        return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the engine against a local stand-in for the completion API.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--backend", choices=["csv", "sqlite"], default="csv")
+    parser.add_argument("--latency", type=float, default=0.05, help="latency of a fake completion, in seconds")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--extractions", type=int, default=20)
+    parser.add_argument("--output", help="JSON file to write the results to, instead of the standard output")
+    args = parser.parse_args()
+
+    results = {"commit": git_commit(), "python": platform.python_version(), "pandas": pd.__version__,
+               "latency_seconds": args.latency, "sizes": []}
+    for size in args.sizes:
+        fake_completion = FakeCompletion(latency_seconds=args.latency)
+        with patched_completion(fake_completion):
+            results["sizes"].append(benchmark_size(size, args.backend, fake_completion, args.repeat, args.extractions))
+        print(f"# benchmarked {size} facts", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, "w") as file:
+            file.write(output)
+
+
+if __name__ == '__main__':
+    main()
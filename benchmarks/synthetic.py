@@ -0,0 +1,31 @@
+import random
+
+
+CATEGORIES = ["Family", "Work", "Friends", "Shopping", "Health", "Finance", "Travel", "Home", "Pets",
+              "Hobbies", "Reminders", "Ideas", "Email", "Phone", "Address", "Other"]
+TYPES = ["List", "Email", "Phone", "Address", "Document", "Pendency", "Price", "Reminder", "Note", "Doubt",
+         "Wish", "Other"]
+PEOPLE = ["", "Self", "mom", "dad", "gym", "building administration", "dentist", "bank", "Alice", "Bob"]
+WORDS = ["phone", "number", "email", "receipt", "aspirin", "ultrasound", "lab", "work", "kit", "reception",
+         "yoga", "ballet", "milk", "bread", "passport", "insurance", "rent", "birthday", "gift", "meeting",
+         "report", "invoice", "flight", "hotel", "vet", "food", "guitar", "lesson", "idea", "app"]
+
+
+def synthetic_facts(n, seed=0):
+    """
+    Generates synthetic facts resembling the ones extracted by the engine.
+
+    Parameters:
+        n (int): The number of facts to generate.
+        seed (int, optional): The seed of the random generator. Default is 0.
+
+    Returns:
+        list: A list of tuples (category, type, people, key, value).
+    """
+    rng = random.Random(seed)
+    facts = []
+    for i in range(n):
+        key = " ".join(rng.sample(WORDS, 2))
+        value = f"{rng.choice(WORDS)} {i}"
+        facts.append((rng.choice(CATEGORIES), rng.choice(TYPES), rng.choice(PEOPLE), key, value))
+    return facts
@@ -5,4 +5,75 @@ from pathlib import Path
 # Directories
 BASE_DIR = Path(os.path.abspath(__file__)).parent.parent.absolute()
 DATA_DIR = Path(BASE_DIR, "data")
-LOG_DIR = Path(DATA_DIR, "log")
\ No newline at end of file
+LOG_DIR = Path(DATA_DIR, "log")
+
+
+# Logging
+LOG_FILE_NAME = "slicemate-{role}.log"  # log file of each role of process (app, server, importer...), in LOG_DIR
+LOG_LEVEL = "INFO"  # "DEBUG" also logs every GPT-3 prompt and completion
+LOG_MAX_BYTES = 10 * 1024 * 1024  # size of the log file before it is rotated
+LOG_BACKUP_COUNT = 5  # number of rotated log files kept
+LOG_PAYLOAD_SAMPLE_RATE = 0.01  # share of the GPT-3 prompts and completions logged at INFO level
+
+
+# Search
+LOCAL_TERMS_MAX_WORDS = 3  # queries with at most this many words have their terms extracted without GPT-3
+MAX_AUGMENTATION_WORKERS = 5  # maximum number of concurrent synonym augmentation calls per query
+ORIGINAL_TERM_WEIGHT = 2.0  # score of a match on a term extracted from the query
+AUGMENTED_TERM_WEIGHT = 1.0  # score of a match on a synonym of those terms
+SEARCH_COLUMN_WEIGHTS = {"Key": 3.0, "Value": 3.0, "People": 2.0, "Category": 1.0, "Type": 1.0}
+SEARCH_MODE = "llm"  # "llm" (GPT-3 term extraction and synonyms) or "local" (offline vector similarity)
+LOCAL_SEARCH_DIMENSIONS = 256  # dimensions of the hashed character n-gram vectors of the local search
+LOCAL_SEARCH_MIN_SIMILARITY = 0.2  # minimum cosine similarity of a local search result
+
+
+# Extraction
+EXTRACTION_BATCH_SIZE = 20  # maximum number of extraction prompts sent in a single completion request
+FEW_SHOT_MAX_EXAMPLES = 3  # maximum number of examples in an extraction prompt, the most similar to the utterance
+FEW_SHOT_MAX_TOKENS = 250  # estimated token budget of the examples in an extraction prompt
+IMPORT_WORKERS = 4  # number of batches of utterances extracted concurrently by the bulk importer
+
+
+# Storage
+STORAGE_BACKEND = "csv"  # "csv" (in-memory DataFrame persisted as CSV files) or "sqlite"
+JOURNAL_COMPACTION_MIN_FACTS = 1000  # the journal is never compacted before holding this many facts
+JOURNAL_COMPACTION_RATIO = 1.0  # compact once the journal holds this many facts per fact in the database file
+STORAGE_READ_CHUNK_ROWS = 50000  # rows read at a time when building an index in the background, queries running in between
+DEDUPLICATE_FACTS = True  # facts equal to a fact of the database, ignoring case and whitespace, are not inserted
+NEAR_DUPLICATE_MODE = None  # None, "flag" (insert and record close variants of a fact) or "merge" (drop them)
+NEAR_DUPLICATE_THRESHOLD = 0.8  # estimated Jaccard similarity of the Key and Value shingles of close variants
+MINHASH_PERMUTATIONS = 32  # hash functions of the MinHash signatures of the near-duplicate index
+LSH_BANDS = 8  # bands the signatures are split into, any equal band making two facts candidates
+
+
+# Export
+EXPORT_CHUNK_ROWS = 10000  # number of rows encoded at a time by the exports
+
+
+# Completion cache
+COMPLETION_CACHE_MAX_BYTES = 64 * 1024 * 1024  # byte budget before least recently used completions are evicted
+COMPLETION_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60  # completions older than this are not reused
+
+
+# GPT-3 API requests
+GPT3_REQUESTS_PER_MINUTE = 3000  # client-side limit, set to the account's quota
+GPT3_TOKENS_PER_MINUTE = 250000  # client-side limit, set to the account's quota
+GPT3_MAX_IN_FLIGHT = 16  # maximum number of concurrent requests
+GPT3_ASYNC_MAX_IN_FLIGHT = 256  # maximum number of concurrent requests of an asynchronous engine
+GPT3_MAX_RETRIES = 4  # retries of a request failing with a rate limit, timeout or server error
+GPT3_BACKOFF_BASE_SECONDS = 0.5  # bound of the random delay before the first retry, doubled on every retry
+GPT3_BACKOFF_MAX_SECONDS = 20  # maximum delay between two retries
+GPT3_DEADLINE_SECONDS = 60  # maximum time spent on a call, including rate limiting and retries
+
+
+# HTTP server
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8000
+SERVER_MAX_BATCH_SIZE = 20  # maximum number of extraction requests coalesced into a single GPT-3 request
+SERVER_MAX_WAIT_SECONDS = 0.02  # maximum time an extraction request waits for others to be batched with
+SERVER_MAX_BATCHES_IN_FLIGHT = 8  # maximum number of batched GPT-3 requests sent concurrently
+SERVER_MAX_PENDING_EXTRACTIONS = 10000  # extractions kept for a later commit, the oldest ones are dropped
+
+
+# Metrics
+METRICS_LATENCY_BUCKETS_SECONDS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
@@ -13,6 +13,9 @@ def app():
         st.session_state['latest_insertions'] = None
     if 'insertion_cancelled' not in st.session_state:
         st.session_state['insertion_cancelled'] = False
+    # the extraction of this session waiting to be committed, the engine being shared by all sessions
+    if 'pending_extraction' not in st.session_state:
+        st.session_state['pending_extraction'] = None
     
     # allowed categories
     all_categories = ["Family", "Work", "Friends", "Shopping", "Health", "Finance", "Travel", "Home", "Pets", "Hobbies", "Reminders",
@@ -44,6 +47,10 @@ def app():
                                                   all_categories,
                                                   engine.allowed_categories())
 
+    search_mode = st.sidebar.radio('Search mode', ["llm", "local"],
+                                   format_func=lambda mode: {"llm": "GPT-3 synonyms", "local": "Local (offline)"}[mode],
+                                   help='Local search ranks the facts by similarity to the query, without calling GPT-3.')
+
     engine.update_categories(selected_categories)
     engine.set_openai_api_key(token)
 
@@ -57,43 +64,71 @@ def app():
     with tab1:
         
         query = st.text_input('Query', '', help='Type a few keywords to query.')
+        category_counts = engine.category_counts_in_database()
+        entry_type_counts = engine.entry_type_counts_in_database()
+        people_counts = engine.people_counts_in_database()
         filter_col1, filter_col2, filter_col3 = st.columns(3)
         with filter_col1:
             categories_filter = st.multiselect(
                                     'Filter by Category:',
-                                    engine.unique_categories_in_database(),
-                                    [])
+                                    list(category_counts),
+                                    [],
+                                    format_func=lambda value: f"{value} ({category_counts[value]})")
         with filter_col2:
             entry_types_filter = st.multiselect(
                                         'Filter by Type:',
-                                        engine.unique_entry_types_in_database(),
-                                        [])
+                                        list(entry_type_counts),
+                                        [],
+                                        format_func=lambda value: f"{value} ({entry_type_counts[value]})")
         with filter_col3:
             people_filter = st.multiselect(
                                         'Filter by People:',
-                                        engine.unique_people_in_database(),
-                                        [])
+                                        list(people_counts),
+                                        [],
+                                        format_func=lambda value: f"{value} ({people_counts[value]})")
+
+        page_col1, page_col2 = st.columns(2)
+        with page_col1:
+            page_size = st.selectbox('Results per page:', [25, 50, 100, 500], index=1)
+        with page_col2:
+            page = st.number_input('Page:', min_value=1, value=1, step=1)
 
         df_results = engine.query(query, 
                                   categories=categories_filter, 
                                   entry_types=entry_types_filter, 
-                                  people=people_filter)
+                                  people=people_filter,
+                                  offset=(page - 1) * page_size,
+                                  limit=page_size,
+                                  search_mode=search_mode)
         st.subheader("Results")
+        total_results = df_results.attrs["total_results"]
+        if len(df_results) > 0:
+            first_result = (page - 1) * page_size + 1
+            st.caption(f"Showing results {first_result} to {first_result + len(df_results) - 1} of {total_results}.")
+        else:
+            st.caption(f"No results to show on this page ({total_results} in total).")
         st.dataframe(df_results, use_container_width=True)
 
         # download results 
-        st.caption("You can download this view of the data as a CSV, TSV or Excel file.")
+        st.caption("You can download all the results of this view of the data as a CSV, TSV, Excel or Parquet file.")
 
-        download_col1, download_col2, download_col3 = st.columns(3)
+        download_col1, download_col2, download_col3, download_col4 = st.columns(4)
         with download_col1:
             generate_excel_download = st.button("Generate downloadable Excel")
         with download_col2:
             generate_csv_download = st.button("Generate downloadable CSV")
         with download_col3:
             generate_tsv_download = st.button("Generate downloadable TSV")
+        with download_col4:
+            generate_parquet_download = st.button("Generate downloadable Parquet")
         
         def export_selected_data(file_type):
-            return engine.export_data_to_binary(df_results, file_type=file_type)
+            df_all_results = engine.query(query, 
+                                          categories=categories_filter, 
+                                          entry_types=entry_types_filter, 
+                                          people=people_filter,
+                                          search_mode=search_mode)
+            return engine.export_data_to_binary(df_all_results, file_type=file_type)
 
         if generate_csv_download:
             st.download_button("Download This Data", 
@@ -111,6 +146,12 @@ def app():
                                         data=export_selected_data(file_type="excel"),
                                         file_name="out.xlsx",
                                         mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+        if generate_parquet_download:
+            st.download_button("Download This Data", 
+                                        data=export_selected_data(file_type="parquet"),
+                                        file_name="out.parquet",
+                                        mime='application/vnd.apache.parquet')
             
     # --------------------------------------------------------------------------------
     # Insert facts tab
@@ -127,19 +168,32 @@ def app():
         manual_check_pane = st.empty() 
         
         # auxiliary function to commit extraction, will be used more than once below
-        def aux_commit_extraction():
-            st.session_state['latest_insertions'] = engine.extracted_facts()
-            engine.commit()
+        def aux_commit_extraction(confirmed=False):
+            pending_extraction = st.session_state['pending_extraction']
+            extracted_facts = pending_extraction.extracted_facts()
+            counts = pending_extraction.commit(confirmed=confirmed)
+            if counts is not None:
+                st.session_state['latest_insertions'] = (extracted_facts, counts)
+            st.session_state['pending_extraction'] = None
             
 
         # EXTRACT: If we don't have extracted facts yet, let's try to do that.
-        if not engine.has_extracted_facts():
+        if st.session_state['pending_extraction'] is None:
             if add_facts:
-                engine.extract_facts(new_facts_utterance)
+                # show the facts as they are extracted
+                pending_extraction = engine.new_extraction(new_facts_utterance)
+                streamed_facts_pane = st.empty()
+                streamed_facts = []
+                for fact in pending_extraction.stream():
+                    streamed_facts.append({"Category": fact[0], "Type": fact[1], "People": fact[2], 
+                                           "Key": fact[3], "Value": fact[4]})
+                    streamed_facts_pane.write(streamed_facts)
+                streamed_facts_pane.empty()
+                st.session_state['pending_extraction'] = pending_extraction
 
         
         # COMMIT: If now we have the extracted facts, prepare to commit or commit them directly.
-        if engine.has_extracted_facts():
+        if st.session_state['pending_extraction'] is not None:
 
             # does the user wants to manually check the extracted facts?
             if manual_check:
@@ -147,13 +201,14 @@ def app():
                     accept = st.button("Accept fact extraction")
                     cancel = st.button("Cancel fact extraction")
                     st.write("Extracted facts:")
-                    st.write(engine.extracted_facts())
+                    st.write(st.session_state['pending_extraction'].extracted_facts())
 
                     if accept:
-                        aux_commit_extraction()
+                        aux_commit_extraction(confirmed=True)
                         
                     elif cancel:
-                        engine.cancel()
+                        st.session_state['pending_extraction'].cancel()
+                        st.session_state['pending_extraction'] = None
                         st.session_state['insertion_cancelled'] = True
 
             else: # no manual check needed, let's just commit
@@ -166,7 +221,10 @@ def app():
     # Status messages           
     # -------------------------------------------------------------------------------- 
     if st.session_state['latest_insertions']  is not None:
-        st.success(f"Added {st.session_state['latest_insertions']}.")
+        extracted_facts, counts = st.session_state['latest_insertions']
+        st.success(f"Added {counts['inserted']} of the facts {extracted_facts}.")
+        if counts['duplicates'] + counts['merged'] > 0:
+            st.info(f"Skipped {counts['duplicates']} duplicate and {counts['merged']} near-duplicate facts.")
         st.session_state['latest_insertions'] = None
         manual_check_pane.empty()
     elif st.session_state['insertion_cancelled'] == True:
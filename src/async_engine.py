@@ -0,0 +1,204 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import aiohttp
+import asyncio
+from config import config
+from src.cache import CompletionCache
+from src.engine import Engine, SEARCH_MODES
+from src.logger import log_payload, logging
+import openai
+
+
+
+# --------------------------------------------------------------------------------
+# Class AsyncEngine
+# --------------------------------------------------------------------------------
+class AsyncEngine:
+    """
+    Asynchronous counterpart of the engine, so that a single event loop can keep many extractions
+    and searches in flight. GPT-3 requests go through `openai.Completion.acreate`, over a connection
+    pool shared by all the requests, while the database, prompts, completion cache and metrics are
+    those of the wrapped `Engine`. Database, completion cache and example store accesses run in
+    worker threads, so that they never block the event loop.
+
+    It is used as an asynchronous context manager, e.g.,
+        `async with AsyncEngine(engine) as async_engine: await async_engine.query("aspirin")`.
+    """
+    def __init__(self, engine=None, max_in_flight=config.GPT3_ASYNC_MAX_IN_FLIGHT, **engine_kwargs):
+        self.engine = engine if engine is not None else Engine(**engine_kwargs)
+        self._max_in_flight = max_in_flight
+        self._session = None
+        self._in_flight = None
+
+    async def open(self):
+        """
+        Opens the connection pool of the GPT-3 requests.
+        """
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._max_in_flight))
+            self._in_flight = asyncio.Semaphore(self._max_in_flight)
+
+    async def close(self):
+        """
+        Closes the connection pool of the GPT-3 requests.
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # --------------------------------------------------------------------------------
+    # Following are the 'Facts Insertion' workflow methods
+    # --------------------------------------------------------------------------------
+    async def new_extraction(self, facts_utterance):
+        """
+        Extracts facts from a natural language utterance, as a handle owned by the caller, like 
+        `Engine.new_extraction` followed by `PendingExtraction.extract`.
+
+        Parameters:
+            facts_utterance (str): The natural language utterance from which to extract facts.
+
+        Returns:
+            PendingExtraction: The extraction, with its facts as `fact_tuples`, to be passed to
+            `commit` or cancelled.
+        """
+        with self.engine.metrics.stage("prompt_build"):
+            # the examples are selected under the lock of the example store, shared with the engine threads
+            prompt = await asyncio.to_thread(self.engine._extraction_prompt, facts_utterance)
+        completion = await self._gpt3_complete(prompt)
+        extraction = self.engine.new_extraction(facts_utterance)
+        with self.engine.metrics.stage("parse"):
+            extraction.fact_tuples = self.engine._postprocessor.string_to_tuples(completion)
+        return extraction
+
+    async def commit(self, extraction, confirmed=False):
+        """
+        Commits the facts of an extraction to the database.
+
+        Parameters:
+            extraction (PendingExtraction): The extraction, as returned by `new_extraction`.
+            confirmed (bool, optional): Flag to indicate that the user checked the extracted facts, in
+                which case they become an example for the extraction of similar utterances. Default is
+                False.
+
+        Returns:
+            dict: The numbers of facts inserted and dropped, as returned by `PendingExtraction.commit`, 
+            or None if there was nothing to commit.
+        """
+        return await asyncio.to_thread(extraction.commit, confirmed)
+
+    # --------------------------------------------------------------------------------
+    # Following are the 'Search' workflow methods
+    # --------------------------------------------------------------------------------
+    async def query(self, fact_query, categories=None, entry_types=None, people=None, show_none_if_no_query=False,
+                    offset=0, limit=None, search_mode=None):
+        """
+        Queries the database for a fact, like `Engine.query`.
+
+        Returns:
+            A DataFrame with the requested page of results, and the total number of results in its
+            `attrs["total_results"]`.
+
+        Note:
+            The synonyms of the terms of the query are generated concurrently.
+        """
+        if search_mode is None:
+            search_mode = self.engine._search_mode
+        elif search_mode not in SEARCH_MODES:
+            raise ValueError("Invalid search mode.")
+
+        if (len(fact_query) == 0 and not show_none_if_no_query) or search_mode == "local":
+            return await asyncio.to_thread(self.engine.query, fact_query, categories, entry_types, people,
+                                           show_none_if_no_query, offset=offset, limit=limit, search_mode=search_mode)
+
+        with self.engine.metrics.stage("query"):
+            original_terms = await self._extract_terms(fact_query)
+            augmented_terms = await self._augment_terms(original_terms)
+            df_results = await asyncio.to_thread(self.engine._ranked_results, original_terms, augmented_terms,
+                                                 categories, entry_types, people)
+            return self.engine._page(df_results, offset, limit)
+
+    async def _extract_terms(self, fact_query):
+        """
+        Extracts the main terms of a query, locally for short keyword queries and with GPT-3 otherwise.
+        """
+        original_terms = self.engine._extract_terms_locally(fact_query)
+        if original_terms is not None:
+            return original_terms
+
+        with self.engine.metrics.stage("prompt_build"):
+            prompt = self.engine._preprocessor.terms_extraction_prompt(fact_query)
+        raw_original_terms = await self._gpt3_complete(prompt)
+        with self.engine.metrics.stage("parse"):
+            return self.engine._postprocessor.extract_lines_from_result(raw_original_terms)
+
+    async def _augment_terms(self, original_terms):
+        """
+        Augments the specified terms with synonyms, issuing the GPT-3 requests concurrently. A term
+        whose augmentation fails contributes no synonyms.
+        """
+        async def aux_augment(original_term):
+            try:
+                with self.engine.metrics.stage("prompt_build"):
+                    prompt = self.engine._preprocessor.terms_augmentation_prompt(original_term)
+                raw_augmented_terms = await self._gpt3_complete(prompt)
+                with self.engine.metrics.stage("parse"):
+                    return self.engine._postprocessor.extract_lines_from_result(raw_augmented_terms)
+            except Exception as e:
+                logging.warning(f"Could not augment term '{original_term}': {e}")
+                return []
+
+        results = await asyncio.gather(*[aux_augment(original_term) for original_term in original_terms])
+        return [term for terms in results for term in terms]
+
+    # --------------------------------------------------------------------------------
+    # Following are the methods for GPT-3 API
+    # --------------------------------------------------------------------------------
+    async def _gpt3_complete(self, prompt):
+        """
+        Completes a prompt using the GPT-3 model, through the completion cache if enabled.
+
+        Parameters:
+            prompt (str): The prompt to be completed.
+
+        Returns:
+            The completion text generated by the GPT-3 model.
+
+        Note:
+            The requests share the rate limits of the engine's scheduler, and at most `max_in_flight`
+                of them are sent at once. The connection pool must have been opened, with `open` or 
+                the context manager.
+        """
+        if self._session is None:
+            raise RuntimeError("The connection pool of the asynchronous engine is not open.")
+        completion_cache = self.engine._completion_cache
+        if completion_cache is not None:
+            cache_key = CompletionCache.key(prompt, {**self.engine.gpt3_parameters, "echo": False})
+            # the cache runs SQLite queries, behind a lock shared with the engine threads
+            completion = await asyncio.to_thread(completion_cache.get, cache_key)
+            if completion is not None:
+                return completion
+
+        # the requests made from this task reuse the connections of the shared session
+        openai.aiosession.set(self._session)
+        with self.engine.metrics.stage("api_call"):
+            response = await self.engine._scheduler.call_async(openai.Completion.acreate,
+                                                               self.engine._gpt3_estimated_tokens(prompt),
+                                                               self._in_flight,
+                                                               **self.engine._gpt3_request_arguments(prompt, echo=False))
+        self.engine._record_gpt3_usage(prompt, response)
+        completion = response['choices'][0]['text']
+        log_payload("GPT-3 Completion", completion)
+
+        if completion_cache is not None:
+            await asyncio.to_thread(completion_cache.put, cache_key, completion)
+        return completion
@@ -0,0 +1,209 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import hashlib
+import json
+from src.logger import logging
+from pathlib import Path
+import sqlite3
+import threading
+import time
+
+
+
+# --------------------------------------------------------------------------------
+# Class CompletionCache
+# --------------------------------------------------------------------------------
+class CompletionCache:
+    """
+    Persistent cache for GPT-3 completions, stored in a SQLite file so that it survives
+    process restarts. Entries are keyed by the prompt and the GPT-3 parameters used to
+    complete it, expire after a time-to-live and are evicted in least-recently-used order
+    once the cache grows past its byte budget.
+
+    Note:
+        Hits only write to the database once `ACCESS_FLUSH_ENTRIES` of them are pending, or before
+            entries are evicted, so that a hit costs a single indexed SELECT. Access times not yet 
+            written when the process stops are lost, which only makes the LRU order less precise.
+    """
+    # number of pending access times written at once
+    ACCESS_FLUSH_ENTRIES = 256
+
+    def __init__(self, file_path, max_bytes, ttl_seconds=None):
+        self._file_path = file_path
+        self._max_bytes = max_bytes
+        self._ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+        # the engine calls the cache from several threads (e.g., concurrent augmentation)
+        self._lock = threading.Lock()
+
+        os.makedirs(Path(file_path).parent, exist_ok=True)
+        self._connection = sqlite3.connect(str(file_path), check_same_thread=False)
+        # the write-ahead log makes commits append to a file rather than sync the database
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS completions (
+                                        key TEXT PRIMARY KEY,
+                                        completion TEXT NOT NULL,
+                                        size INTEGER NOT NULL,
+                                        created_at REAL NOT NULL,
+                                        accessed_at REAL NOT NULL)""")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS completions_accessed_at ON completions (accessed_at)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS completions_created_at ON completions (created_at)")
+        self._connection.commit()
+
+        # the size of the entries, kept up to date so that puts do not sum it
+        self._total_bytes = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        # access times of the hits, not yet written, by key
+        self._pending_accesses = {}
+        logging.info(f"Opened completion cache in {self._file_path} with {len(self)} entries.")
+
+    @staticmethod
+    def key(prompt, parameters):
+        """
+        Builds the cache key of a prompt.
+
+        Parameters:
+            prompt (str): The prompt to be completed.
+            parameters (dict): The GPT-3 parameters used to complete the prompt.
+
+        Returns:
+            str: A digest identifying the prompt and parameters.
+        """
+        payload = json.dumps({"prompt": prompt, "parameters": parameters}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Looks up a completion in the cache, refreshing its position in the LRU order.
+
+        Parameters:
+            key (str): The cache key, as built by `key`.
+
+        Returns:
+            The cached completion text, or None if it is missing or expired.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute("SELECT completion, created_at FROM completions WHERE key = ?",
+                                           (key,)).fetchone()
+            if row is not None and self._ttl_seconds is not None and now - row[1] > self._ttl_seconds:
+                self._delete([key])
+                self._connection.commit()
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._pending_accesses[key] = now
+            if len(self._pending_accesses) >= self.ACCESS_FLUSH_ENTRIES:
+                self._flush_accesses()
+                self._connection.commit()
+            self.hits += 1
+            return row[0]
+
+    def _flush_accesses(self):
+        """
+        Writes the pending access times. Must be called with the lock held.
+        """
+        if len(self._pending_accesses) > 0:
+            self._connection.executemany("UPDATE completions SET accessed_at = ? WHERE key = ?",
+                                         [(accessed_at, key) for key, accessed_at in self._pending_accesses.items()])
+            self._pending_accesses = {}
+
+    def _delete(self, keys):
+        """
+        Deletes entries, keeping the total size up to date. Must be called with the lock held.
+
+        Parameters:
+            keys (list): The keys of the entries.
+        """
+        for key in keys:
+            row = self._connection.execute("SELECT size FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._connection.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self._total_bytes -= row[0]
+            self._pending_accesses.pop(key, None)
+
+    def put(self, key, completion):
+        """
+        Stores a completion in the cache, evicting the least recently used entries if the
+        byte budget is exceeded.
+
+        Parameters:
+            key (str): The cache key, as built by `key`.
+            completion (str): The completion text to store.
+        """
+        size = len(completion.encode('utf-8'))
+        if size > self._max_bytes:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._delete([key])
+            self._connection.execute("INSERT INTO completions VALUES (?, ?, ?, ?, ?)",
+                                     (key, completion, size, now, now))
+            self._total_bytes += size
+            self._evict(now)
+            self._connection.commit()
+
+    def _evict(self, now):
+        """
+        Removes the expired entries and, while the cache is over its byte budget, the least
+        recently used ones. Must be called with the lock held.
+
+        Parameters:
+            now (float): The current timestamp.
+        """
+        if self._ttl_seconds is not None:
+            expired_keys = [key for key, in self._connection.execute(
+                "SELECT key FROM completions WHERE created_at < ?", (now - self._ttl_seconds,)).fetchall()]
+            self._delete(expired_keys)
+
+        if self._total_bytes <= self._max_bytes:
+            return
+
+        # the LRU order must account for the recent hits
+        self._flush_accesses()
+        excess_bytes = self._total_bytes - self._max_bytes
+        evicted_keys = []
+        for key, size in self._connection.execute("SELECT key, size FROM completions ORDER BY accessed_at"):
+            evicted_keys.append(key)
+            excess_bytes -= size
+            if excess_bytes <= 0:
+                break
+        self._delete(evicted_keys)
+        logging.info(f"Evicted {len(evicted_keys)} entries from the completion cache.")
+
+    def clear(self):
+        """
+        Removes all the entries from the cache and resets the hit/miss counters.
+        """
+        with self._lock:
+            self._connection.execute("DELETE FROM completions")
+            self._connection.commit()
+            self._total_bytes = 0
+            self._pending_accesses = {}
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Returns the cache statistics.
+
+        Returns:
+            dict: The number of entries, their total size in bytes, and the hit/miss counters.
+        """
+        with self._lock:
+            entries = self._connection.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+            total_bytes = self._total_bytes
+        return {"entries": entries, "bytes": total_bytes, "max_bytes": self._max_bytes,
+                "hits": self.hits, "misses": self.misses}
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
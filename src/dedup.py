@@ -0,0 +1,255 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.logger import logging
+from src.storage import COLUMNS
+import numpy as np
+import pandas as pd
+import zlib
+
+
+MINHASH_PRIME = np.uint64((1 << 31) - 1)
+SHINGLE_SIZE = 3
+# rows hashed at a time when building the near-duplicate index, to bound the memory of the hash matrices
+MINHASH_CHUNK_ROWS = 2000
+
+
+def normalized_column(series):
+    """
+    Normalizes the values of a column for duplicate detection: lowercase, whitespace collapsed, and
+    missing values as empty strings.
+    """
+    # the values are normalized once per distinct value, as categories, types and people repeat a lot
+    codes, uniques = pd.factorize(series.astype(object))
+    uniques = (pd.Series(uniques, dtype=object).astype(str).str.lower()
+               .str.replace(r"\s+", " ", regex=True).str.strip())
+    normalized = uniques.to_numpy()[codes] if len(uniques) > 0 else np.full(len(codes), "", dtype=object)
+    return pd.Series(np.where(codes < 0, "", normalized), index=series.index, dtype=object)
+
+
+def fact_hashes(df):
+    """
+    Hashes the normalized facts of a DataFrame.
+
+    Parameters:
+        df (pandas.DataFrame): The facts, with the columns Category, Type, People, Key and Value.
+
+    Returns:
+        A NumPy uint64 array with the hash of each fact, equal for facts differing only in case
+        or whitespace. The hashes are computed by pandas in a single vectorized pass, and are stable
+        across processes.
+    """
+    normalized = pd.DataFrame({column: normalized_column(df[column]) for column in COLUMNS})
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+
+
+def minhash_signatures(texts, permutations):
+    """
+    Computes the MinHash signatures of the character shingles of texts.
+
+    Parameters:
+        texts (list): The normalized texts.
+        permutations (numpy.ndarray): The (a, b) coefficients of the hash functions, of shape (2, n).
+
+    Returns:
+        A NumPy uint64 array of shape (len(texts), n). The share of equal values between two
+        signatures estimates the Jaccard similarity of the shingles of the texts. Texts shorter than
+        a shingle get the signature of their whole text.
+    """
+    signatures = np.empty((len(texts), permutations.shape[1]), dtype=np.uint64)
+    for start in range(0, len(texts), MINHASH_CHUNK_ROWS):
+        chunk = texts[start:start + MINHASH_CHUNK_ROWS]
+        shingle_hashes = []
+        counts = []
+        for text in chunk:
+            shingles = {text[i:i + SHINGLE_SIZE] for i in range(max(1, len(text) - SHINGLE_SIZE + 1))}
+            shingle_hashes += [zlib.crc32(shingle.encode("utf-8")) & 0x7FFFFFFF for shingle in shingles]
+            counts.append(len(shingles))
+
+        hashes = np.array(shingle_hashes, dtype=np.uint64)[:, None]
+        # (a * h + b) mod p, without overflow since a, b and h are below 2^31
+        permuted = (hashes * permutations[0] + permutations[1]) % MINHASH_PRIME
+        offsets = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+        signatures[start:start + len(chunk)] = np.minimum.reduceat(permuted, offsets, axis=0)
+    return signatures
+
+
+
+# --------------------------------------------------------------------------------
+# Class NearDuplicateIndex
+# --------------------------------------------------------------------------------
+class NearDuplicateIndex:
+    """
+    Locality-sensitive hashing index of the MinHash signatures of the facts' Key and Value, finding
+    the facts whose texts are close variants of a new one without comparing it to every fact.
+    """
+    def __init__(self, threshold, permutations, bands):
+        self.threshold = threshold
+        self._bands = bands
+        self._rows_per_band = permutations // bands
+        self._permutations = np.random.RandomState(0).randint(1, int(MINHASH_PRIME), size=(2, permutations),
+                                                              dtype=np.int64).astype(np.uint64)
+        self._signatures = {}
+        self._buckets = [{} for _ in range(bands)]
+
+    @staticmethod
+    def texts(df):
+        """
+        Returns the normalized Key and Value of facts, as compared by the index.
+        """
+        return ((normalized_column(df["Key"]) + " " + normalized_column(df["Value"])).str.strip()).tolist()
+
+    def signatures(self, texts):
+        return minhash_signatures(texts, self._permutations)
+
+    def _band_keys(self, signature):
+        return [signature[band * self._rows_per_band:(band + 1) * self._rows_per_band].tobytes()
+                for band in range(self._bands)]
+
+    def add(self, row_ids, signatures):
+        """
+        Indexes the signatures of facts.
+
+        Parameters:
+            row_ids (list): The row ids of the facts.
+            signatures (numpy.ndarray): Their signatures, as computed by `signatures`.
+        """
+        for row_id, signature in zip(row_ids, signatures):
+            row_id = int(row_id)
+            self._signatures[row_id] = signature
+            for buckets, band_key in zip(self._buckets, self._band_keys(signature)):
+                buckets.setdefault(band_key, []).append(row_id)
+
+    def similarity(self, signature, other_signature):
+        """
+        Estimates the Jaccard similarity of the shingles of two facts from their signatures.
+        """
+        return float(np.count_nonzero(signature == other_signature)) / len(signature)
+
+    def find(self, signature):
+        """
+        Finds the indexed fact most similar to a signature, if it is similar enough.
+
+        Returns:
+            The row id of the most similar fact at least `threshold` similar, or None.
+        """
+        candidates = set()
+        for buckets, band_key in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(buckets.get(band_key, []))
+
+        best_row_id, best_similarity = None, 0.0
+        for row_id in sorted(candidates):
+            similarity = self.similarity(signature, self._signatures[row_id])
+            if similarity >= self.threshold and similarity > best_similarity:
+                best_row_id, best_similarity = row_id, similarity
+        return best_row_id
+
+    def __len__(self):
+        return len(self._signatures)
+
+
+
+# --------------------------------------------------------------------------------
+# Class FactDeduplicator
+# --------------------------------------------------------------------------------
+class FactDeduplicator:
+    """
+    Suppresses duplicate facts on insertion. Exact duplicates, once normalized, are rejected
+    through a set of fact hashes. Optionally, close variants of a fact already in the database,
+    by their Key and Value, are either flagged or merged into it, i.e., not inserted.
+    """
+    def __init__(self, near_duplicate_mode=None, near_duplicate_threshold=0.8, minhash_permutations=32,
+                 lsh_bands=8):
+        if near_duplicate_mode not in [None, "flag", "merge"]:
+            raise ValueError("Invalid near-duplicate mode.")
+        self._near_duplicate_mode = near_duplicate_mode
+        self._hashes = None
+        self._near_duplicate_index = None
+        if near_duplicate_mode is not None:
+            self._near_duplicate_index = NearDuplicateIndex(near_duplicate_threshold, minhash_permutations, lsh_bands)
+        # pairs (row id of an inserted fact, row id of the fact it is a close variant of)
+        self.flagged_near_duplicates = []
+
+    def build(self, dfs):
+        """
+        Indexes the facts of the database.
+
+        Parameters:
+            dfs (iterable): The whole database, as DataFrames indexed by row id, e.g., chunks of it.
+        """
+        hashes = set()
+        facts_count = 0
+        for df in dfs:
+            hashes.update(fact_hashes(df).tolist())
+            if self._near_duplicate_index is not None:
+                self._near_duplicate_index.add(df.index, self._near_duplicate_index.signatures(NearDuplicateIndex.texts(df)))
+            facts_count += len(df)
+        self._hashes = hashes
+        logging.info(f"Built duplicate index over {facts_count} facts.")
+
+    def filter(self, fact_tuples):
+        """
+        Filters out the duplicates among new facts, before their insertion.
+
+        Parameters:
+            fact_tuples (list): The tuples (category, type, people, key, value) to insert.
+
+        Returns:
+            tuple: The facts to insert, their state to pass to `add` once inserted, and the numbers of
+                exact duplicates and of merged near-duplicates that were dropped.
+        """
+        df = pd.DataFrame([tuple(fact_tuple) for fact_tuple in fact_tuples], columns=COLUMNS)
+        hashes = fact_hashes(df).tolist()
+        signatures = None
+        if self._near_duplicate_index is not None:
+            signatures = self._near_duplicate_index.signatures(NearDuplicateIndex.texts(df))
+
+        kept_positions = []
+        near_duplicates = {}  # position in the kept facts -> row id, or negative position in the kept facts - 1
+        exact_duplicates, merged_near_duplicates = 0, 0
+        batch_hashes = set()
+        for position, fact_hash in enumerate(hashes):
+            if fact_hash in self._hashes or fact_hash in batch_hashes:
+                exact_duplicates += 1
+                continue
+
+            if signatures is not None:
+                similar = self._near_duplicate_index.find(signatures[position])
+                if similar is None:
+                    # close variants within the new facts themselves
+                    for kept, kept_position in enumerate(kept_positions):
+                        if self._near_duplicate_index.similarity(signatures[position], signatures[kept_position]) \
+                                >= self._near_duplicate_index.threshold:
+                            similar = -kept - 1
+                            break
+                if similar is not None:
+                    if self._near_duplicate_mode == "merge":
+                        merged_near_duplicates += 1
+                        continue
+                    near_duplicates[len(kept_positions)] = similar
+
+            batch_hashes.add(fact_hash)
+            kept_positions.append(position)
+
+        kept_fact_tuples = [fact_tuples[position] for position in kept_positions]
+        state = ([hashes[position] for position in kept_positions],
+                 None if signatures is None else signatures[kept_positions],
+                 near_duplicates)
+        return kept_fact_tuples, state, exact_duplicates, merged_near_duplicates
+
+    def add(self, row_ids, state):
+        """
+        Indexes newly inserted facts.
+
+        Parameters:
+            row_ids (list): The row ids given to the facts returned by `filter`.
+            state (tuple): The state returned by `filter`.
+        """
+        hashes, signatures, near_duplicates = state
+        self._hashes.update(hashes)
+        if signatures is not None:
+            self._near_duplicate_index.add(row_ids, signatures)
+            for kept, similar in near_duplicates.items():
+                similar_row_id = similar if similar >= 0 else row_ids[-similar - 1]
+                self.flagged_near_duplicates.append((int(row_ids[kept]), int(similar_row_id)))
@@ -2,13 +2,43 @@ import os
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
+from concurrent.futures import ThreadPoolExecutor
 from config import config
 import io
-from src.logger import logging
+from src.cache import CompletionCache
+from src.dedup import FactDeduplicator
+from src.example_store import BUILTIN_EXAMPLES, ExampleStore
+from src.logger import log_payload, logging
+from src.metrics import Metrics
+from src.rwlock import ReadWriteLock
+from src.scheduler import RequestScheduler
+from src.storage import CsvStorage, SqliteStorage, TOKEN_PATTERN, tokenize
+from src.vector_index import VectorIndex
+import numpy as np
 import openai
 import pandas as pd
 from pathlib import Path
+import re
+import string
+import threading
+from types import MappingProxyType
 
+# optional dependencies of the exports
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+SEARCH_MODES = ["llm", "local"]
+
+# the tokens of many values joined by unit separators (U+001F), the separators being matched as well
+SEPARATED_TOKEN_PATTERN = re.compile(TOKEN_PATTERN.pattern + "|\x1f")
 
 
 # --------------------------------------------------------------------------------
@@ -26,32 +56,44 @@ class Engine:
                  gpt3_engine = "text-davinci-003", gpt3_temperature=0.1,
                  gpt3_frequency_penalty=-0.5, gpt3_presence_penalty=-0.6, 
                  default_categories=["Family", "Work", "Friends", "Shopping", "Health", 
-                                     "Finance", "Travel", "Home", "Pets", "Hobbies", "Other"]):
+                                     "Finance", "Travel", "Home", "Pets", "Hobbies", "Other"],
+                 max_augmentation_workers=config.MAX_AUGMENTATION_WORKERS,
+                 completion_cache_file_path=Path(config.DATA_DIR, "completion_cache.sqlite"),
+                 use_completion_cache=True,
+                 journal_file_path=None,
+                 storage_backend=config.STORAGE_BACKEND,
+                 sqlite_file_path=Path(config.DATA_DIR, "default_database.sqlite"),
+                 search_mode=config.SEARCH_MODE,
+                 vectors_file_path=None,
+                 local_terms_max_words=config.LOCAL_TERMS_MAX_WORDS,
+                 examples_file_path=Path(config.DATA_DIR, "confirmed_examples.jsonl"),
+                 deduplicate_facts=config.DEDUPLICATE_FACTS,
+                 near_duplicate_mode=config.NEAR_DUPLICATE_MODE):
         
 
-        self._database_file_path = database_file_path
-        self._categories_file_path = categories_file_path
         self._categories = default_categories
 
-        # load the database or create it from scratch if needed
-        try:
-            self.database = pd.read_csv(self._database_file_path)
-            logging.info(f"Loaded database from {self._database_file_path}.")
-        except FileNotFoundError:
-            self.database = pd.DataFrame(columns=["Category", "Type", "People", "Key", "Value"])
-            self._save()
-            logging.info(f"Created database in {self._database_file_path}.")
-        
+        # durations of the engine stages, token usage and sizes, exported with `metrics.export`
+        self.metrics = Metrics(config.METRICS_LATENCY_BUCKETS_SECONDS)
+
+        # the storage of the database and categories, CSV files or a SQLite database
+        if storage_backend == "csv":
+            # each database has its own journal, next to it
+            if journal_file_path is None:
+                journal_file_path = Path(database_file_path).with_name(Path(database_file_path).stem + "_journal.csv")
+            self._storage = CsvStorage(database_file_path, categories_file_path, journal_file_path)
+        elif storage_backend == "sqlite":
+            self._storage = SqliteStorage(sqlite_file_path)
+        else:
+            raise ValueError("Invalid storage backend.")
 
-        # load the categories file or create it from scratch if needed
-        try:
-            df_categories = pd.read_csv(self._categories_file_path)
-            self._categories = df_categories["Category"].tolist()
-            logging.info(f"Loaded categories {self._categories} from {self._categories_file_path}.")
-        except FileNotFoundError:
-            self.database = pd.DataFrame(default_categories, columns=["Category"])
+        # load the categories or create them from scratch if needed
+        categories = self._storage.load_categories()
+        if categories is not None:
+            self._categories = categories
+        else:
             self._save()
-            logging.info(f"Created categories {self._categories} in {self._categories_file_path}.")
+            logging.info(f"Created categories {self._categories}.")
 
 
         openai.api_key = api_key
@@ -59,12 +101,87 @@ class Engine:
                                 "max_tokens":200, "top_p":1.0, "frequency_penalty":gpt3_frequency_penalty, 
                                 "presence_penalty":gpt3_presence_penalty, "stop":None}
 
-        self._current_extracted_facts = None
+        # the extraction of `extract_facts` and `commit`, for single-user callers; concurrent users 
+        # each get their own `PendingExtraction` from `new_extraction`
+        self._current_extraction = None
+
+        # queries read concurrently, while commits and category updates are serialized
+        self._lock = ReadWriteLock()
+
+        # shared by all the GPT-3 calls of the engine, whatever thread they come from
+        self._scheduler = RequestScheduler(requests_per_minute=config.GPT3_REQUESTS_PER_MINUTE,
+                                           tokens_per_minute=config.GPT3_TOKENS_PER_MINUTE,
+                                           max_in_flight=config.GPT3_MAX_IN_FLIGHT,
+                                           max_retries=config.GPT3_MAX_RETRIES,
+                                           backoff_base_seconds=config.GPT3_BACKOFF_BASE_SECONDS,
+                                           backoff_max_seconds=config.GPT3_BACKOFF_MAX_SECONDS,
+                                           deadline_seconds=config.GPT3_DEADLINE_SECONDS)
+        self._max_augmentation_workers = max_augmentation_workers
+        self._local_terms_max_words = local_terms_max_words
+        self._term_extraction_counts = {"local": 0, "gpt3": 0}
+
+        # completions are deterministic enough (low temperature) to be reused across queries and restarts
+        self._completion_cache = None
+        if use_completion_cache:
+            self._completion_cache = CompletionCache(completion_cache_file_path,
+                                                     max_bytes=config.COMPLETION_CACHE_MAX_BYTES,
+                                                     ttl_seconds=config.COMPLETION_CACHE_TTL_SECONDS)
+
+        # the few-shot examples of the extraction prompt, selected per utterance
+        self._example_store = ExampleStore(examples_file_path, config.LOCAL_SEARCH_DIMENSIONS)
 
         # create preprocessor and postprocessor for GPT-3 inputs and outputs, respectively
         self._preprocessor = Preprocessor()
         self._postprocessor = Postprocessor()
 
+        # the local semantic index is only loaded once local search is used, then kept up to date
+        if search_mode not in SEARCH_MODES:
+            raise ValueError("Invalid search mode.")
+        self._search_mode = search_mode
+        # each database has its own vector index, next to it
+        if vectors_file_path is None:
+            storage_file_path = Path(database_file_path if storage_backend == "csv" else sqlite_file_path)
+            vectors_file_path = storage_file_path.with_name(storage_file_path.name + ".vectors.bin")
+        self._vectors_file_path = vectors_file_path
+        self._vector_index = None
+        self._vector_index_lock = threading.Lock()
+        if self._search_mode == "local":
+            self._local_vector_index()
+
+        # the duplicate index is built in the background as the engine starts, then kept up to date; 
+        # commits wait for it, queries do not
+        self._deduplicator = None
+        self._deduplicator_ready = threading.Event()
+        if deduplicate_facts:
+            self._deduplicator = FactDeduplicator(near_duplicate_mode=near_duplicate_mode,
+                                                  near_duplicate_threshold=config.NEAR_DUPLICATE_THRESHOLD,
+                                                  minhash_permutations=config.MINHASH_PERMUTATIONS,
+                                                  lsh_bands=config.LSH_BANDS)
+            threading.Thread(target=self._build_deduplicator, name="FactDeduplicator", daemon=True).start()
+
+        self.metrics.register_gauge("database_facts", lambda: len(self._storage))
+        self.metrics.register_gauge("local_index_facts",
+                                    lambda: len(self._vector_index) if self._vector_index is not None else None)
+        for statistic in ["entries", "bytes", "hits", "misses"]:
+            self.metrics.register_gauge(f"completion_cache_{statistic}",
+                                        lambda statistic=statistic: self._completion_cache_statistic(statistic))
+        self.metrics.register_gauge("completion_cache_hit_ratio", lambda: self._completion_cache_statistic("hit_ratio"))
+
+    @property
+    def database(self):
+        """
+        The whole database, as a DataFrame with the columns Category, Type, People, Key and Value.
+        """
+        with self._lock.read():
+            return self._storage.dataframe()
+
+    def fact_count(self):
+        """
+        Returns the number of facts of the database, without reading them.
+        """
+        with self._lock.read():
+            return len(self._storage)
+
     def _save(self):
         """
         Saves the current state of the database and allowed categories.
@@ -74,21 +191,32 @@ class Engine:
 
         Returns:
             None
-        """
-        logging.info(f"Database has {len(self.database)} facts.")
-        logging.info(f"Available categories are {self._categories}")
-        
-        #os.makedirs(os.path.dirname(self._database_file_path), exist_ok=True)
-        self.database.to_csv(self._database_file_path, index=False)
-        pd.DataFrame(self._categories, columns=["Category"]).to_csv(self._categories_file_path, index=False)
 
-        logging.info(f"Saved database in {self._database_file_path}.")
-        logging.info(f"Saved allowed categories in {self._categories_file_path}.")
+        Note:
+            Only what changed since the last save is written, as decided by the storage.
+        """
+        with self.metrics.stage("save"):
+            self._storage.save()
+            self._storage.save_categories(self._categories)
         
     # --------------------------------------------------------------------------------
     # Following are the 'Facts Insertion' workflow methods
     # --------------------------------------------------------------------------------
 
+    def new_extraction(self, facts_utterance):
+        """
+        Starts the extraction of facts from a natural language utterance, as a handle owned by the 
+        caller, e.g., a user session.
+
+        Parameters:
+            facts_utterance (str): The natural language utterance from which to extract facts.
+
+        Returns:
+            PendingExtraction: The extraction, to be run with `extract` or `stream`, then committed 
+            or cancelled independently of the other extractions of the engine.
+        """
+        return PendingExtraction(self, facts_utterance)
+
     def extract_facts(self, facts_utterance):
         """
         Extracts facts from a natural language utterance.
@@ -98,11 +226,152 @@ class Engine:
 
         Returns:
             A list of tuples (category, type, people, key, value).
+
+        Note:
+            The facts become the current extracted facts of the engine, shared by all its callers. 
+                Concurrent users should each use their own `new_extraction` instead.
         """
-        fact_tuples = self._postprocessor.string_to_tuples(self._gpt3_complete(self._preprocessor.extraction_prompt(facts_utterance, self._categories)))
-        self._current_extracted_facts = fact_tuples
+        extraction = self.new_extraction(facts_utterance)
+        fact_tuples = extraction.extract()
+        self._current_extraction = extraction
         return fact_tuples
+
+    def _extract_fact_tuples(self, facts_utterance):
+        """
+        Extracts facts from a natural language utterance, without changing the state of the engine.
+
+        Parameters:
+            facts_utterance (str): The natural language utterance from which to extract facts.
+
+        Returns:
+            A list of tuples (category, type, people, key, value).
+        """
+        with self.metrics.stage("prompt_build"):
+            prompt = self._extraction_prompt(facts_utterance)
+        completion = self._gpt3_complete(prompt)
+        with self.metrics.stage("parse"):
+            return self._postprocessor.string_to_tuples(completion)
+
+    def _extraction_prompt(self, facts_utterance):
+        """
+        Builds the extraction prompt of an utterance, with the few-shot examples most similar to it.
+
+        Parameters:
+            facts_utterance (str): The natural language utterance from which to extract facts.
+
+        Returns:
+            str: The extraction prompt.
+
+        Note:
+            At most `config.FEW_SHOT_MAX_EXAMPLES` examples are selected, within an estimated budget of 
+                `config.FEW_SHOT_MAX_TOKENS` tokens, among the built-in examples and the extractions 
+                confirmed with `commit(confirmed=True)`.
+        """
+        examples = self._example_store.select(facts_utterance, config.FEW_SHOT_MAX_EXAMPLES, config.FEW_SHOT_MAX_TOKENS)
+        return self._preprocessor.extraction_prompt(facts_utterance, self._categories, examples)
     
+    def extract_facts_stream(self, facts_utterance):
+        """
+        Extracts facts from a natural language utterance, yielding each fact as soon as the GPT-3 
+        model has completed its line.
+
+        Parameters:
+            facts_utterance (str): The natural language utterance from which to extract facts.
+
+        Yields:
+            The tuples (category, type, people, key, value), in order.
+
+        Note:
+            Once the generator is exhausted, the facts are available as the current extracted facts, 
+                just like after `extract_facts`.
+        """
+        extraction = self.new_extraction(facts_utterance)
+        yield from extraction.stream()
+        self._current_extraction = extraction
+
+    def _extract_fact_tuples_stream(self, facts_utterance):
+        """
+        Extracts facts from a natural language utterance, yielding each fact as soon as the GPT-3 
+        model has completed its line, without changing the state of the engine.
+
+        Parameters:
+            facts_utterance (str): The natural language utterance from which to extract facts.
+
+        Yields:
+            The tuples (category, type, people, key, value), in order.
+        """
+        with self.metrics.stage("prompt_build"):
+            prompt = self._extraction_prompt(facts_utterance)
+        pending_text = ""
+        for text in self._gpt3_stream(prompt):
+            pending_text += text
+            # only complete lines can be parsed, the last one may still be growing
+            *complete_lines, pending_text = pending_text.split("\n")
+            for line in complete_lines:
+                with self.metrics.stage("parse"):
+                    line_fact_tuples = self._postprocessor.string_to_tuples(line)
+                yield from line_fact_tuples
+
+        with self.metrics.stage("parse"):
+            line_fact_tuples = self._postprocessor.string_to_tuples(pending_text)
+        yield from line_fact_tuples
+
+    def extract_facts_many(self, facts_utterances, batch_size=config.EXTRACTION_BATCH_SIZE, commit=False,
+                           raise_errors=False):
+        """
+        Extracts facts from many natural language utterances, sending several prompts per GPT-3 request.
+
+        Parameters:
+            facts_utterances (list): The natural language utterances from which to extract facts.
+            batch_size (int, optional): The maximum number of prompts sent in a single request. 
+                Default is `config.EXTRACTION_BATCH_SIZE`.
+            commit (bool, optional): Flag to commit all the extracted facts to the database, with a 
+                single write, once the extraction is done. Default is False.
+            raise_errors (bool, optional): Flag to raise the error of a failed GPT-3 request instead of 
+                reporting it in the results of its utterances. Default is False.
+
+        Returns:
+            A list with one dictionary per utterance, in the same order as `facts_utterances`, with 
+            the keys "utterance", "facts" (a list of tuples (category, type, people, key, value)) and 
+            "error" (None, or a message explaining why some or all of the facts could not be extracted).
+
+        Note:
+            Unlike `extract_facts`, this method does not change the current extracted facts. The 
+                results can be committed later on with `commit_many`.
+        """
+        facts_utterances = list(facts_utterances)
+        results = []
+        for start in range(0, len(facts_utterances), batch_size):
+            batch_utterances = facts_utterances[start:start + batch_size]
+            with self.metrics.stage("prompt_build"):
+                prompts = [self._extraction_prompt(facts_utterance) for facts_utterance in batch_utterances]
+            try:
+                completions = self._gpt3_complete_many(prompts)
+            except Exception as e:
+                if raise_errors:
+                    raise
+                logging.warning(f"Could not extract facts from a batch of {len(batch_utterances)} utterances: {e}")
+                results += [{"utterance": facts_utterance, "facts": [], "error": str(e)} 
+                            for facts_utterance in batch_utterances]
+                continue
+
+            for facts_utterance, completion in zip(batch_utterances, completions):
+                if completion is None:
+                    logging.warning(f"No completion returned for '{facts_utterance}'.")
+                    results.append({"utterance": facts_utterance, "facts": [], "error": "No completion returned"})
+                    continue
+                with self.metrics.stage("parse"):
+                    fact_tuples, rejected_lines = self._postprocessor.parse_tuples(completion)
+                error = None
+                if len(rejected_lines) > 0:
+                    logging.warning(f"Rejected lines extracted from '{facts_utterance}': {rejected_lines}")
+                    error = f"Could not parse {len(rejected_lines)} lines of the completion: {rejected_lines}"
+                results.append({"utterance": facts_utterance, "facts": fact_tuples, "error": error})
+
+        if commit:
+            self.commit_many(results)
+        return results
+
     def has_extracted_facts(self):
         """
         Checks if facts have been extracted.
@@ -111,7 +380,7 @@ class Engine:
             True: If facts have been extracted and are available.
             False: If no facts have been extracted or if they have been cleared.
         """
-        return self._current_extracted_facts is not None
+        return self._current_extraction is not None and self._current_extraction.has_extracted_facts()
     
     def extracted_facts(self):
         """
@@ -120,12 +389,20 @@ class Engine:
         Returns:
             A list of dictionaries representing the extracted facts.
         """
-        return [{"Category": fact[0], "Type": fact[1], "People": fact[2], "Key": fact[3], "Value": fact[4]} 
-                 for fact in self._current_extracted_facts]
+        return self._current_extraction.extracted_facts()
 
-    def commit(self):
+    def commit(self, confirmed=False):
         """
         Commits the current extracted facts to the database.
+
+        Parameters:
+            confirmed (bool, optional): Flag to indicate that the user checked the extracted facts, in 
+                which case they become an example for the extraction of similar utterances. Default is 
+                False.
+
+        Returns:
+            dict: The numbers of facts "inserted", and of "duplicates" and "merged" near-duplicates 
+            dropped, as returned by `_insert_facts`, or None if there was nothing to commit.
        
         Note:
             If no facts have been extracted, the function logs a message indicating that there is 
@@ -133,13 +410,30 @@ class Engine:
             The insertion process and database saving are handled by internal methods `_insert_facts`
                 and `_save`, respectively.
         """	
-        if self._current_extracted_facts is not None:
-            self._insert_facts()
-            self._current_extracted_facts = None
-            self._save()
-        else:
-            logging.info("Nothing to commit.")
+        if self.has_extracted_facts():
+            counts = self._current_extraction.commit(confirmed)
+            self._current_extraction = None
+            return counts
+        logging.info("Nothing to commit.")
+        return None
     
+    def commit_many(self, results):
+        """
+        Commits the facts of many extractions to the database, with a single write.
+
+        Parameters:
+            results (list): The extraction results, as returned by `extract_facts_many`.
+
+        Returns:
+            dict: The numbers of facts "inserted", and of "duplicates" and "merged" near-duplicates 
+            dropped, as returned by `_insert_facts`.
+        """
+        fact_tuples = [fact_tuple for result in results for fact_tuple in result["facts"]]
+        if len(fact_tuples) == 0:
+            logging.info("Nothing to commit.")
+            return {"inserted": 0, "duplicates": 0, "merged": 0}
+        return self._commit_facts(fact_tuples)
+
     def cancel(self):
         """
         Cancel the current extracted facts.
@@ -148,38 +442,116 @@ class Engine:
             If no facts have been extracted, the function logs a message indicating that there is 
                 nothing to revert.
         """	
-        if self._current_extracted_facts is not None:
-            self._current_extracted_facts = None
+        if self.has_extracted_facts():
+            self._current_extraction.cancel()
+            self._current_extraction = None
         else:
             logging.info("Nothing to revert.")
 
-    def _insert_facts(self, facts_utterance = None):
+    def _commit_facts(self, fact_tuples, facts_utterance=None, confirmed=False):
         """
-        Inserts a fact into the database.
+        Inserts facts into the database and saves it, as a single write.
 
         Parameters:
-            facts_utterance (str, optional): The natural language utterance from which to extract facts. 
+            fact_tuples (list): The tuples (category, type, people, key, value) to insert. They may come 
+                from many utterances.
+            facts_utterance (str, optional): The utterance the facts were extracted from, if a single one. 
                 Default is None.
+            confirmed (bool, optional): Flag to add the facts, checked by the user, to the examples of 
+                the extraction prompt. Default is False.
+
+        Returns:
+            dict: The numbers of facts "inserted", and of "duplicates" and "merged" near-duplicates 
+            dropped, as returned by `_insert_facts`.
+
+        Note:
+            Writes are serialized, and wait for the queries reading the database to be done, as well 
+                as for the duplicate index to be built.
         """
-        # reuse the extracted facts, if any
-        if self._current_extracted_facts is None:
-            fact_tuples = self.extract_facts(facts_utterance)
-        else:
-            fact_tuples = self._current_extracted_facts
-            
-        for fact_tuple in fact_tuples:
-            logging.info(f"Database has {len(self.database)} facts before insertion.")
-            logging.info(f"Inserting fact: {fact_tuple}")
-            
-            df_to_add = pd.DataFrame([fact_tuple], columns=["Category", "Type", "People", "Key", "Value"])
-            self.database = pd.concat([self.database, df_to_add], ignore_index=True)
-            logging.info(f"Database has {len(self.database)} facts after insertion.")
+        if self._deduplicator is not None:
+            self._deduplicator_ready.wait()
+        with self._lock.write():
+            counts = self._insert_facts(fact_tuples)
+            self._save()
+        if confirmed and facts_utterance is not None:
+            self._example_store.add(facts_utterance, fact_tuples)
+        return counts
+
+    def _insert_facts(self, fact_tuples):
+        """
+        Inserts facts into the database, all at once. Must be called with the write lock held.
+
+        Parameters:
+            fact_tuples (list): The tuples (category, type, people, key, value) to insert.
+
+        Returns:
+            dict: The numbers of facts "inserted", of exact "duplicates" dropped, and of near-duplicates 
+            "merged" into existing facts, i.e., dropped too.
+
+        Note:
+            Unless deduplication is disabled, the facts equal to a fact of the database, or to a
+                previous fact of `fact_tuples`, once case and whitespace are normalized, are not
+                inserted, nor are their close variants in near-duplicate "merge" mode.
+        """
+        exact_duplicates, merged_near_duplicates = 0, 0
+        if self._deduplicator is not None:
+            with self.metrics.stage("deduplicate"):
+                fact_tuples, state, exact_duplicates, merged_near_duplicates = self._deduplicator.filter(fact_tuples)
+            self.metrics.increment("duplicate_facts_rejected", exact_duplicates)
+            self.metrics.increment("near_duplicate_facts_merged", merged_near_duplicates)
+            if exact_duplicates + merged_near_duplicates > 0:
+                logging.info(f"Dropped {exact_duplicates} duplicate and {merged_near_duplicates} near-duplicate facts.")
+            if len(fact_tuples) == 0:
+                return {"inserted": 0, "duplicates": exact_duplicates, "merged": merged_near_duplicates}
+
+        with self.metrics.stage("insert"):
+            row_ids = self._storage.insert(fact_tuples)
+            if self._vector_index is not None:
+                self._vector_index.add(row_ids, [self._fact_text(fact_tuple) for fact_tuple in fact_tuples])
+        self.metrics.increment("facts_inserted", len(fact_tuples))
+
+        if self._deduplicator is not None:
+            flagged = len(self._deduplicator.flagged_near_duplicates)
+            self._deduplicator.add(row_ids, state)
+            self.metrics.increment("near_duplicate_facts_flagged", len(self._deduplicator.flagged_near_duplicates) - flagged)
+        return {"inserted": len(fact_tuples), "duplicates": exact_duplicates, "merged": merged_near_duplicates}
+
+    def _build_deduplicator(self):
+        """
+        Builds the duplicate index over the facts of the database, in a background thread.
+
+        Note:
+            The facts are read and hashed a chunk at a time, so that queries run in between. The 
+                lock is not held, as commits, the only writes of facts, wait for the index, and holding 
+                it would make the readers queue behind any category update. Should the build fail, 
+                facts are inserted without deduplication.
+        """
+        try:
+            self._deduplicator.build(self._storage.dataframe_chunks(config.STORAGE_READ_CHUNK_ROWS))
+        except Exception as e:
+            logging.error(f"Could not build the duplicate index, facts will not be deduplicated: {e}")
+            self._deduplicator = None
+        finally:
+            self._deduplicator_ready.set()
+
+    def near_duplicate_facts(self):
+        """
+        Returns the close variants of existing facts that were inserted in near-duplicate "flag" mode.
+
+        Returns:
+            list: Pairs (row id of the inserted fact, row id of the fact it is a close variant of).
+        """
+        with self._lock.read():
+            if self._deduplicator is None:
+                return []
+            return list(self._deduplicator.flagged_near_duplicates)
 
 
     # --------------------------------------------------------------------------------
     # Following are the 'Search' workflow methods
     # --------------------------------------------------------------------------------
-    def query(self, fact_query, categories=None, entry_types=None, people=None, show_none_if_no_query=False, verbose=False):
+    def query(self, fact_query, categories=None, entry_types=None, people=None, show_none_if_no_query=False, verbose=False,
+              offset=0, limit=None, search_mode=None):
         """
         Queries the database for a fact.
 
@@ -196,61 +568,364 @@ class Engine:
                 Default is False.
             verbose (bool, optional): Flag to enable verbose output for the intermediate steps of the 
                 query process. Default is False.
+            offset (int, optional): The number of results to skip, for pagination. Default is 0.
+            limit (int, optional): The maximum number of results to return, for pagination. Default is 
+                None (all the results).
+            search_mode (str, optional): "llm" to search for the terms extracted from the query and their 
+                synonyms, as generated by GPT-3, or "local" to search for the facts most similar to the 
+                query without any network call. Default is None (the mode the engine was created with).
 
         Returns:
             If a fact query is provided or `show_none_if_no_query` is True:
                 It returns the search result as a filtered DataFrame based on the specified parameters 
-                and the terms extracted and augmented from the fact query.
+                and the terms extracted and augmented from the fact query, without duplicates and 
+                with the best matches first.
             If no fact query is provided and `show_none_if_no_query` is False:
                 It returns the filtered database without performing any additional search or 
                 term extraction.
+            In both cases, only the results between `offset` and `offset + limit` are returned, and the 
+            total number of results is available in the `attrs["total_results"]` of the DataFrame.
         """
-        if len(fact_query) > 0 or show_none_if_no_query:
-            raw_original_terms = self._gpt3_complete(self._preprocessor.terms_extraction_prompt(fact_query))
-            original_terms = self._postprocessor.extract_lines_from_result(raw_original_terms)
-            if verbose:
-                logging.info(f"Original Terms: {original_terms}")
-
-            augmented_terms = []
-            for original_term in original_terms:
-                raw_augmented_terms = self._gpt3_complete(self._preprocessor.terms_augmentation_prompt(original_term))
-                augmented_terms += self._postprocessor.extract_lines_from_result(raw_augmented_terms)
-            if verbose:
-                logging.info(f"Augmented Terms: {augmented_terms}")
+        with self.metrics.stage("query"):
+            if search_mode is None:
+                search_mode = self._search_mode
+            elif search_mode not in SEARCH_MODES:
+                raise ValueError("Invalid search mode.")
+
+            if (len(fact_query) > 0 or show_none_if_no_query) and search_mode == "local":
+                return self._local_search(fact_query, categories, entry_types, people, offset, limit)
+
+            elif len(fact_query) > 0 or show_none_if_no_query:
+                original_terms = self._extract_terms(fact_query)
+                if verbose:
+                    logging.info(f"Original Terms: {original_terms}")
+
+                augmented_terms = self._augment_terms(original_terms)
+                if verbose:
+                    logging.info(f"Augmented Terms: {augmented_terms}")
             
-            return self._search_dataframe(self._database_filtered_by(categories, entry_types, people),
-                                        original_terms, augmented_terms)
-        else:
-            return self._database_filtered_by(categories, entry_types, people)
+                df_results = self._ranked_results(original_terms, augmented_terms, categories, entry_types, people)
+            else:
+                # the storage only builds the requested page of the filtered database
+                return self._database_filtered_by(categories, entry_types, people, offset, limit)
+
+            return self._page(df_results, offset, limit)
 
-    def _search_dataframe(self, df, original_terms, augmented_terms):
+    def _ranked_results(self, original_terms, augmented_terms, categories=None, entry_types=None, people=None):
         """
-        Searches the specified database for the specified terms.
+        Searches the database for the terms of a query, the best matches first.
 
         Parameters:
-            df (pandas.DataFrame): The database to search in.
             original_terms (list): The original terms extracted from the query.
             augmented_terms (list): The augmented terms extracted from the query.
+            categories (list, optional): A list of categories to filter the database. Default is None.
+            entry_types (list, optional): A list of entry types to filter the database. Default is None.
+            people (list, optional): A list of people to filter the database. Default is None.
 
         Returns:
-            A new DataFrame containing the rows from the specified database (`df`) that 
-            match any of the original or augmented terms.
+            A DataFrame with the matching facts, without duplicates, sorted by decreasing score.
+        """
+        df_results = self._search_dataframe(original_terms, augmented_terms, categories, entry_types, people)
+        df_results = df_results[~df_results.index.duplicated()]
+        scores = self._score_results(df_results, original_terms, augmented_terms)
+        # stable sort, so that equally scored results keep the database order from one page to the next
+        return df_results.iloc[np.argsort(-scores, kind="stable")]
+
+    @staticmethod
+    def _page(df_results, offset=0, limit=None):
+        """
+        Returns a page of results, with the total number of results in its `attrs["total_results"]`.
         """
-        df = df.fillna("") # for readability below
-        all_terms = original_terms + augmented_terms
+        total_results = len(df_results)
+        df_results = df_results.iloc[offset:None if limit is None else offset + limit]
+        df_results.attrs["total_results"] = total_results
+        return df_results
 
-        df_results = None
-        for column in df.columns:
-            df_result = df[df[column].str.contains("|".join(all_terms), case=False).fillna(False)]
-            if df_results is None:
-                df_results = df_result
-            else:
-                df_results = pd.concat([df_results, df_result])
-        
+    def _local_search(self, fact_query, categories=None, entry_types=None, people=None, offset=0, limit=None):
+        """
+        Searches the database for the facts most similar to the query, using the local semantic index.
+
+        Parameters:
+            fact_query (str): The specific fact query to search for in the database.
+            categories (list, optional): A list of categories to filter the database. Default is None.
+            entry_types (list, optional): A list of entry types to filter the database. Default is None.
+            people (list, optional): A list of people to filter the database. Default is None.
+            offset (int, optional): The number of results to skip. Default is 0.
+            limit (int, optional): The maximum number of results to return. Default is None.
+
+        Returns:
+            A DataFrame with the requested page of results, most similar first, and the total number 
+            of results, i.e., filtered facts at least `config.LOCAL_SEARCH_MIN_SIMILARITY` similar to 
+            the query, in its `attrs["total_results"]`.
+        """
+        allowed_ids = None
+        if any(values is not None and len(values) > 0 for values in [categories, entry_types, people]):
+            allowed_ids = self._database_filtered_by(categories, entry_types, people).index.to_numpy()
+
+        vector_index = self._local_vector_index()
+        with self.metrics.stage("search"), self._lock.read():
+            row_ids, _ = vector_index.search(fact_query, config.LOCAL_SEARCH_MIN_SIMILARITY, allowed_ids)
+            page_row_ids = row_ids[offset:None if limit is None else offset + limit]
+            df_results = self._storage.rows(page_row_ids)
+        df_results.attrs["total_results"] = len(row_ids)
         return df_results
 
+    def _local_vector_index(self):
+        """
+        Returns the local semantic index of the database, loading it and indexing the facts it misses 
+        if needed.
+
+        Returns:
+            VectorIndex: The vector index of the facts.
+        """
+        with self._vector_index_lock:
+            if self._vector_index is None:
+                # no facts may be inserted while the index catches up with the database
+                with self._lock.read():
+                    vector_index = VectorIndex(self._vectors_file_path, config.LOCAL_SEARCH_DIMENSIONS)
+                    if not self._vector_index_matches(vector_index):
+                        # the database was replaced, the index has to be rebuilt
+                        logging.info(f"Discarded {self._vectors_file_path}, built from another database.")
+                        vector_index.clear()
+
+                    if len(vector_index) < len(self._storage):
+                        df = self._storage.dataframe()
+                        if vector_index.last_id() is not None:
+                            df = df[df.index > vector_index.last_id()]
+                        vector_index.add(df.index.to_numpy(), 
+                                         [self._fact_text(fact_tuple) for fact_tuple in df.itertuples(index=False, name=None)])
+                        logging.info(f"Indexed {len(df)} facts in {self._vectors_file_path}.")
+                    self._vector_index = vector_index
+            return self._vector_index
+
+    def _vector_index_matches(self, vector_index):
+        """
+        Checks that a loaded vector index was built from the database, as far as it goes. Must be 
+        called with the read lock held.
+
+        Parameters:
+            vector_index (VectorIndex): The loaded index.
+
+        Returns:
+            bool: True if the index has at most as many facts as the database, and its first and last 
+                facts have the vectors of the facts of the database with the same row ids.
+        """
+        if len(vector_index) == 0:
+            return True
+        if len(vector_index) > len(self._storage):
+            return False
+
+        row_ids = [vector_index.first_id(), vector_index.last_id()]
+        try:
+            df = self._storage.rows(row_ids)
+        except (IndexError, KeyError):
+            return False
+        return vector_index.matches(row_ids, [self._fact_text(fact_tuple) 
+                                              for fact_tuple in df.itertuples(index=False, name=None)])
+
+    @staticmethod
+    def _fact_text(fact_tuple):
+        """
+        Returns the text of a fact, as embedded by the local semantic index.
+
+        Parameters:
+            fact_tuple (tuple): The fact (category, type, people, key, value).
+
+        Returns:
+            str: The non-empty fields of the fact, separated by spaces.
+        """
+        return " ".join(field for field in fact_tuple if isinstance(field, str) and len(field) > 0)
+
+    def _score_results(self, df, original_terms, augmented_terms):
+        """
+        Scores the search results by the terms they match and the columns they match them in.
+
+        Parameters:
+            df (pandas.DataFrame): The search results.
+            original_terms (list): The original terms extracted from the query.
+            augmented_terms (list): The augmented terms extracted from the query.
+
+        Returns:
+            A NumPy array with the score of each row of `df`: for every term and column where the term 
+            matches, its last token possibly as a prefix, the weight of the term (`config.ORIGINAL_TERM_WEIGHT` or `config.AUGMENTED_TERM_WEIGHT`) 
+            times the weight of the column (`config.SEARCH_COLUMN_WEIGHTS`).
+        """
+        weighted_terms = {}
+        for term, weight in [(term, config.AUGMENTED_TERM_WEIGHT) for term in augmented_terms] + \
+                            [(term, config.ORIGINAL_TERM_WEIGHT) for term in original_terms]:
+            tokens = tuple(tokenize(term))
+            if len(tokens) > 0:
+                weighted_terms[tokens] = weight # an original term outweighs the same term as a synonym
+
+        scores = np.zeros(len(df))
+        if len(df) == 0 or len(weighted_terms) == 0:
+            return scores
+        for column, column_weight in config.SEARCH_COLUMN_WEIGHTS.items():
+            term_matches = self._term_matches(df[column], list(weighted_terms))
+            for matches, term_weight in zip(term_matches, weighted_terms.values()):
+                scores += matches * (term_weight * column_weight)
+        return scores
+
+    @staticmethod
+    def _term_matches(values, terms):
+        """
+        Finds the values containing terms, as the storages match them: all the tokens of a term, the 
+        last one possibly as a prefix.
+
+        Parameters:
+            values (pandas.Series): The values of a column.
+            terms (list): The terms, as tuples of tokens.
+
+        Returns:
+            list: A boolean NumPy array per term, with an element per value.
+
+        Note:
+            Only the distinct values are tokenized, at once and for all the terms. Their tokens are then 
+                matched with NumPy, through a sorted vocabulary in which the tokens starting with a 
+                prefix are a contiguous range.
+        """
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            codes, uniques = values.cat.codes.to_numpy(), values.cat.categories.to_numpy()
+        else:
+            codes, uniques = pd.factorize(values.to_numpy())
+        # a single regular expression search over all the values, each token owned by the value after as 
+        # many separators
+        pieces = np.array(SEPARATED_TOKEN_PATTERN.findall(
+            "\x1f".join(value if isinstance(value, str) else "" for value in uniques).lower()), dtype=object)
+        is_separator = pieces == "\x1f"
+        owners = np.cumsum(is_separator)[~is_separator]
+        # codes in the sorted vocabulary, in which the tokens starting with a prefix are a contiguous range
+        token_codes, vocabulary = pd.factorize(pieces[~is_separator], sort=True)
+        vocabulary = np.asarray(vocabulary, dtype=object)
+
+        def aux_values_with(first_code, end_code):
+            has_token = np.zeros(len(uniques) + 1, dtype=bool)
+            has_token[owners[(token_codes >= first_code) & (token_codes < end_code)]] = True
+            return has_token
+
+        term_matches = []
+        for tokens in terms:
+            # the last element stands for the missing values, of code -1
+            matches = np.ones(len(uniques) + 1, dtype=bool)
+            matches[-1] = False
+            for token in set(tokens[:-1]):
+                first_code = np.searchsorted(vocabulary, token)
+                matches &= aux_values_with(first_code, first_code + 1 if first_code < len(vocabulary) and
+                                           vocabulary[first_code] == token else first_code)
+            prefix = tokens[-1]
+            matches &= aux_values_with(np.searchsorted(vocabulary, prefix), 
+                                       np.searchsorted(vocabulary, prefix + "\U0010ffff"))
+            term_matches.append(matches[codes])
+        return term_matches
+
+    def _extract_terms(self, fact_query):
+        """
+        Extracts the main terms of a query, locally for short keyword queries and with GPT-3 otherwise.
+
+        Parameters:
+            fact_query (str): The query.
+
+        Returns:
+            A list of the terms of the query.
+
+        Note:
+            Queries of at most `local_terms_max_words` words are split into their words, stopwords 
+                removed. Longer queries, or short ones made only of stopwords, go through the terms 
+                extraction prompt. The number of queries handled each way is available through 
+                `term_extraction_stats`.
+        """
+        original_terms = self._extract_terms_locally(fact_query)
+        if original_terms is not None:
+            return original_terms
+
+        with self.metrics.stage("prompt_build"):
+            prompt = self._preprocessor.terms_extraction_prompt(fact_query)
+        raw_original_terms = self._gpt3_complete(prompt)
+        with self.metrics.stage("parse"):
+            return self._postprocessor.extract_lines_from_result(raw_original_terms)
+
+    def _extract_terms_locally(self, fact_query):
+        """
+        Extracts the terms of a short keyword query without GPT-3, counting how each query is handled.
+
+        Parameters:
+            fact_query (str): The query.
+
+        Returns:
+            A list of the terms of the query, or None if it has to go through the terms extraction prompt.
+        """
+        if len(fact_query.split()) <= self._local_terms_max_words:
+            original_terms = self._preprocessor.local_terms(fact_query)
+            if len(original_terms) > 0:
+                self._term_extraction_counts["local"] += 1
+                logging.info(f"Extracted terms {original_terms} locally.")
+                return original_terms
+
+        self._term_extraction_counts["gpt3"] += 1
+        return None
+
+    def term_extraction_stats(self):
+        """
+        Returns how many queries had their terms extracted locally and how many with GPT-3.
+
+        Returns:
+            A dictionary with the keys "local" and "gpt3", and the word threshold under which 
+            queries are handled locally as "local_terms_max_words".
+        """
+        return {**self._term_extraction_counts, "local_terms_max_words": self._local_terms_max_words}
+
+    def _augment_terms(self, original_terms):
+        """
+        Augments the specified terms with synonyms, issuing the GPT-3 calls concurrently.
+
+        Parameters:
+            original_terms (list): The original terms extracted from the query.
+
+        Returns:
+            A list with the synonyms of all the original terms, in the same order as the 
+            original terms. A term whose augmentation fails contributes no synonyms.
+        """
+        if len(original_terms) == 0:
+            return []
+
+        def aux_augment(original_term):
+            try:
+                with self.metrics.stage("prompt_build"):
+                    prompt = self._preprocessor.terms_augmentation_prompt(original_term)
+                raw_augmented_terms = self._gpt3_complete(prompt)
+                with self.metrics.stage("parse"):
+                    return self._postprocessor.extract_lines_from_result(raw_augmented_terms)
+            except Exception as e:
+                logging.warning(f"Could not augment term '{original_term}': {e}")
+                return []
+
+        max_workers = max(1, min(self._max_augmentation_workers, len(original_terms)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # map() yields the results in the order of the original terms, whatever the completion order
+            results = list(executor.map(aux_augment, original_terms))
+
+        return [term for terms in results for term in terms]
+
+    def _search_dataframe(self, original_terms, augmented_terms, categories=None, entry_types=None, people=None):
+        """
+        Searches the database for the specified terms.
+
+        Parameters:
+            original_terms (list): The original terms extracted from the query.
+            augmented_terms (list): The augmented terms extracted from the query.
+            categories (list, optional): A list of categories to filter the database. Default is None.
+            entry_types (list, optional): A list of entry types to filter the database. Default is None.
+            people (list, optional): A list of people to filter the database. Default is None.
+
+        Returns:
+            A new DataFrame containing the rows from the filtered database that 
+            match any of the original or augmented terms.
+        """
+        with self.metrics.stage("search"), self._lock.read():
+            return self._storage.search(original_terms + augmented_terms, categories, entry_types, people)
+
 
-    def _database_filtered_by(self, categories=None, entry_types=None, people=None):
+    def _database_filtered_by(self, categories=None, entry_types=None, people=None, offset=0, limit=None):
         """
         Filters the main database based on the specified categories, entry types, and people.
 
@@ -258,23 +933,16 @@ class Engine:
             categories (list, optional): A list of categories to filter the database. Default is None.
             entry_types (list, optional): A list of entry types to filter the database. Default is None.
             people (list, optional): A list of people to filter the database. Default is None.
+            offset (int, optional): The number of filtered rows to skip. Default is 0.
+            limit (int, optional): The maximum number of filtered rows to return. Default is None.
 
         Returns:
             A new DataFrame that contains the filtered rows based on the specified categories, 
-            entry types, and people.
+            entry types, and people, between `offset` and `offset + limit`, and the total number of 
+            filtered rows in its `attrs["total_results"]`.
         """
-        df = self.database
-
-        def aux_filter(df, column, values):
-            if values is not None and len(values) > 0:
-                return df[self.database[column].str.lower().isin([v.lower() for v in values])]
-            else:
-                return df
-        
-        df = aux_filter(df, "Category", categories)
-        df = aux_filter(df, "Type", entry_types)
-        df = aux_filter(df, "People", people)
-        return df
+        with self.metrics.stage("filter"), self._lock.read():
+            return self._storage.filtered(categories, entry_types, people, offset, limit)
     
     def unique_categories_in_database(self):
         """
@@ -282,8 +950,12 @@ class Engine:
 
         Returns:
             A list of unique categories present in the database.
+
+        Note:
+            The distinct values are maintained as facts are inserted, so no scan of the database is needed.
         """
-        return self.database["Category"].unique().tolist()
+        with self._lock.read():
+            return self._storage.unique("Category")
     
     def unique_entry_types_in_database(self):
         """
@@ -292,7 +964,8 @@ class Engine:
         Returns:
             A list of unique entry types present in the database.
         """
-        return self.database["Type"].unique().tolist()
+        with self._lock.read():
+            return self._storage.unique("Type")
         
     def unique_people_in_database(self):
         """
@@ -301,7 +974,39 @@ class Engine:
         Returns:
             A list of unique people present in the database.
         """
-        return self.database["People"].unique().tolist()
+        with self._lock.read():
+            return self._storage.unique("People")
+
+    def category_counts_in_database(self):
+        """
+        Returns the number of facts for each category present in the database.
+
+        Returns:
+            A read-only mapping from the categories present in the database to their number of facts.
+        """
+        with self._lock.read():
+            # a copy, so that later insertions do not change it while it is being read
+            return MappingProxyType(dict(self._storage.facet_counts("Category")))
+
+    def entry_type_counts_in_database(self):
+        """
+        Returns the number of facts for each entry type present in the database.
+
+        Returns:
+            A read-only mapping from the entry types present in the database to their number of facts.
+        """
+        with self._lock.read():
+            return MappingProxyType(dict(self._storage.facet_counts("Type")))
+
+    def people_counts_in_database(self):
+        """
+        Returns the number of facts for each person present in the database.
+
+        Returns:
+            A read-only mapping from the people present in the database to their number of facts.
+        """
+        with self._lock.read():
+            return MappingProxyType(dict(self._storage.facet_counts("People")))
 
     # --------------------------------------------------------------------------------
     # Following are the methods for 'Categories' management
@@ -322,13 +1027,78 @@ class Engine:
         Parameters:
             new_categories (list): The new categories to be set as the allowed categories.
         """
-        self._categories = new_categories
-        self._save()
+        if new_categories == self._categories:
+            return
+        with self._lock.write():
+            self._categories = new_categories
+            self._save()
 
 
     # --------------------------------------------------------------------------------
     # Following are the methods for GPT-3 API
     # --------------------------------------------------------------------------------
+    def _gpt3_create(self, prompt, **kwargs):
+        """
+        Sends a completion request to the GPT-3 API, through the request scheduler.
+
+        Parameters:
+            prompt (str or list): The prompt, or the list of prompts, to be completed.
+            **kwargs: Additional arguments of the request, e.g., `echo` or `stream`.
+
+        Returns:
+            The response of the API.
+
+        Note:
+            The scheduler keeps the requests and tokens per minute under `config.GPT3_REQUESTS_PER_MINUTE` 
+                and `config.GPT3_TOKENS_PER_MINUTE`, retries transient failures and gives up after 
+                `config.GPT3_DEADLINE_SECONDS`. The tokens of a request are estimated from the length 
+                of its prompts (about 4 characters per token) plus the maximum completion length.
+            The duration of the call and the tokens reported in the `usage` of the response are 
+                recorded in the metrics.
+        """
+        with self.metrics.stage("api_call"):
+            response = self._scheduler.call(openai.Completion.create, self._gpt3_estimated_tokens(prompt), 
+                                            **self._gpt3_request_arguments(prompt, **kwargs))
+        self._record_gpt3_usage(prompt, response, stream=kwargs.get("stream", False))
+        return response
+
+    def _gpt3_estimated_tokens(self, prompt):
+        """
+        Estimates the tokens used by the completion of a prompt, or of a list of prompts, from their 
+        length (about 4 characters per token) plus the maximum completion length.
+        """
+        prompts = prompt if isinstance(prompt, list) else [prompt]
+        return sum(len(p) // 4 + self.gpt3_parameters["max_tokens"] for p in prompts)
+
+    def _gpt3_request_arguments(self, prompt, **kwargs):
+        """
+        Returns the arguments of a completion request with the GPT-3 parameters of the engine.
+
+        Parameters:
+            prompt (str or list): The prompt, or the list of prompts, to be completed.
+            **kwargs: Additional arguments of the request, e.g., `echo` or `stream`.
+        """
+        return dict(engine=self.gpt3_parameters["engine"],
+                    prompt=prompt,
+                    temperature=self.gpt3_parameters["temperature"],
+                    max_tokens=self.gpt3_parameters["max_tokens"],
+                    top_p=self.gpt3_parameters["top_p"],
+                    frequency_penalty=self.gpt3_parameters["frequency_penalty"],
+                    presence_penalty=self.gpt3_parameters["presence_penalty"],
+                    stop=self.gpt3_parameters["stop"],
+                    **kwargs)
+
+    def _record_gpt3_usage(self, prompt, response, stream=False):
+        """
+        Records a completion request, and the tokens reported in the `usage` of its response, in the metrics.
+        """
+        self.metrics.increment("api_requests")
+        self.metrics.increment("api_prompts", len(prompt) if isinstance(prompt, list) else 1)
+        # streamed responses do not report their usage
+        if not stream and response.get("usage") is not None:
+            self.metrics.increment("prompt_tokens", response["usage"].get("prompt_tokens", 0))
+            self.metrics.increment("completion_tokens", response["usage"].get("completion_tokens", 0))
+
     def _gpt3_complete(self, prompt, echo=False):
         """
         Completes a prompt using the GPT-3 model.
@@ -340,21 +1110,123 @@ class Engine:
 
         Returns:
             The completion text generated by the GPT-3 model.
+
+        Note:
+            If the completion cache is enabled, completions are looked up there first, keyed by the 
+                prompt and the current GPT-3 parameters, and stored there after each API call.
         """
-        response = openai.Completion.create(
-            engine=self.gpt3_parameters["engine"],
-            prompt=prompt,
-            temperature=self.gpt3_parameters["temperature"],
-            max_tokens=self.gpt3_parameters["max_tokens"],
-            top_p=self.gpt3_parameters["top_p"],
-            frequency_penalty=self.gpt3_parameters["frequency_penalty"],
-            presence_penalty=self.gpt3_parameters["presence_penalty"],
-            stop=self.gpt3_parameters["stop"],
-            echo=echo
-        )
+        if self._completion_cache is not None:
+            cache_key = CompletionCache.key(prompt, {**self.gpt3_parameters, "echo": echo})
+            completion = self._completion_cache.get(cache_key)
+            if completion is not None:
+                return completion
+
+        response = self._gpt3_create(prompt, echo=echo)
         completion = response['choices'][0]['text']
+        log_payload("GPT-3 Completion", completion)
+
+        if self._completion_cache is not None:
+            self._completion_cache.put(cache_key, completion)
         return completion
 
+    def _gpt3_stream(self, prompt):
+        """
+        Completes a prompt using the GPT-3 model, streaming the completion.
+
+        Parameters:
+            prompt (str): The prompt to be completed.
+
+        Yields:
+            The successive pieces of the completion text, as they are generated.
+
+        Note:
+            A completion found in the completion cache, if enabled, is yielded at once. Streamed 
+                completions are only cached once they have been fully received.
+        """
+        if self._completion_cache is not None:
+            cache_key = CompletionCache.key(prompt, {**self.gpt3_parameters, "echo": False})
+            completion = self._completion_cache.get(cache_key)
+            if completion is not None:
+                yield completion
+                return
+
+        response = self._gpt3_create(prompt, stream=True)
+        completion = ""
+        for chunk in response:
+            text = chunk['choices'][0]['text']
+            completion += text
+            yield text
+        log_payload("GPT-3 Completion", completion)
+
+        if self._completion_cache is not None:
+            self._completion_cache.put(cache_key, completion)
+
+    def _gpt3_complete_many(self, prompts):
+        """
+        Completes several prompts using the GPT-3 model, with a single request.
+
+        Parameters:
+            prompts (list): The prompts to be completed.
+
+        Returns:
+            A list with the completion text of each prompt, in the same order as `prompts`, or None
+            for a prompt the response has no choice for.
+
+        Note:
+            Prompts found in the completion cache, if enabled, are not sent to the API.
+        """
+        completions = [None] * len(prompts)
+        cache_keys = [None] * len(prompts)
+        if self._completion_cache is not None:
+            for i, prompt in enumerate(prompts):
+                cache_keys[i] = CompletionCache.key(prompt, {**self.gpt3_parameters, "echo": False})
+                completions[i] = self._completion_cache.get(cache_keys[i])
+
+        missing = [i for i, completion in enumerate(completions) if completion is None]
+        if len(missing) == 0:
+            return completions
+
+        response = self._gpt3_create([prompts[i] for i in missing])
+        # the choices are not guaranteed to come back in order, but each one carries the index of its prompt
+        for choice in response['choices']:
+            i = missing[choice['index']]
+            completions[i] = choice['text']
+            log_payload("GPT-3 Completion", completions[i])
+            if self._completion_cache is not None:
+                self._completion_cache.put(cache_keys[i], completions[i])
+        return completions
+
+    def completion_cache_stats(self):
+        """
+        Returns the statistics of the completion cache.
+
+        Returns:
+            A dictionary with the number of entries, their size in bytes and the hit/miss counters, 
+            or None if the cache is disabled.
+        """
+        if self._completion_cache is None:
+            return None
+        return self._completion_cache.stats()
+
+    def _completion_cache_statistic(self, statistic):
+        """
+        Returns a statistic of the completion cache, as a gauge of the metrics.
+
+        Parameters:
+            statistic (str): A key of `completion_cache_stats`, or "hit_ratio" for the share of the 
+                lookups that were hits.
+
+        Returns:
+            The value of the statistic, or None if the cache is disabled or, for the hit ratio, unused.
+        """
+        stats = self.completion_cache_stats()
+        if stats is None:
+            return None
+        if statistic == "hit_ratio":
+            lookups = stats["hits"] + stats["misses"]
+            return stats["hits"] / lookups if lookups > 0 else None
+        return stats[statistic]
+
     def set_openai_api_key(self, key):
         """
         Sets the OpenAI API key for authentication.
@@ -373,49 +1245,223 @@ class Engine:
 
         Parameters:
             df (pandas.DataFrame): The DataFrame to be exported.
-            file_type (str, optional): The file type for the export. Default is None.
+            file_type (str, optional): The file type for the export, "excel", "csv", "tsv", "parquet" or 
+                "arrow" (Arrow IPC file). Default is None ("excel").
 
         Returns:
             The binary representation of the exported data.
+
+        Note:
+            Excel files are written row by row in constant memory when XlsxWriter is installed. Parquet 
+                and Arrow files, which require PyArrow, keep the column types and are much smaller 
+                and faster to write and read.
         """
         if file_type is None:
             file_type = "excel"
         
         if file_type == "excel":
             memory_output = io.BytesIO()
-            with pd.ExcelWriter(memory_output) as writer:  
-                df.to_excel(writer)
+            if xlsxwriter is not None:
+                self._export_excel_constant_memory(df, memory_output)
+            else:
+                with pd.ExcelWriter(memory_output) as writer:  
+                    df.to_excel(writer)
             return memory_output
 
-        elif file_type == "csv":
-            return df.to_csv().encode('utf-8')
-        
-        elif file_type == "tsv":
-            return df.to_csv(sep='\t').encode('utf-8')
+        elif file_type in ["csv", "tsv"]:
+            return b"".join(self.export_data_chunks(df, file_type=file_type))
+
+        elif file_type in ["parquet", "arrow"]:
+            if pyarrow is None:
+                raise ImportError(f"Exporting to {file_type} requires PyArrow.")
+            table = pyarrow.Table.from_pandas(df)
+            memory_output = io.BytesIO()
+            if file_type == "parquet":
+                pyarrow.parquet.write_table(table, memory_output)
+            else:
+                with pyarrow.ipc.new_file(memory_output, table.schema) as writer:
+                    writer.write_table(table, max_chunksize=config.EXPORT_CHUNK_ROWS)
+            return memory_output.getvalue()
         
         else:
             raise ValueError("Invalid file type.")
 
+    def export_data_chunks(self, df, file_type="csv", chunk_rows=config.EXPORT_CHUNK_ROWS):
+        """
+        Exports a DataFrame to CSV or TSV, chunk by chunk, e.g., to stream a download.
+
+        Parameters:
+            df (pandas.DataFrame): The DataFrame to be exported.
+            file_type (str, optional): "csv" or "tsv". Default is "csv".
+            chunk_rows (int, optional): The number of rows encoded at a time. Default is 
+                `config.EXPORT_CHUNK_ROWS`.
+
+        Yields:
+            The successive bytes of the file, the header with the first chunk.
+        """
+        if file_type not in ["csv", "tsv"]:
+            raise ValueError("Invalid file type.")
+        separator = "," if file_type == "csv" else "\t"
+        # an empty DataFrame still gets its header
+        for start in range(0, max(len(df), 1), chunk_rows):
+            yield df.iloc[start:start + chunk_rows].to_csv(sep=separator, header=start == 0).encode('utf-8')
+
+    @staticmethod
+    def _export_excel_constant_memory(df, output):
+        """
+        Writes a DataFrame to an Excel file with XlsxWriter, in constant memory.
+
+        Parameters:
+            df (pandas.DataFrame): The DataFrame to be exported, its index as the first column, as 
+                `DataFrame.to_excel` does.
+            output (str or file-like): The file to write.
+
+        Note:
+            In constant memory mode, each row is flushed to disk once the next one is written, so rows 
+                have to be written in order, unlike `DataFrame.to_excel` which writes column by column.
+        """
+        workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+        worksheet = workbook.add_worksheet()
+        worksheet.write_row(0, 1, [str(column) for column in df.columns])
+        row_number = 1
+        for start in range(0, len(df), config.EXPORT_CHUNK_ROWS):
+            # missing values are written as blank cells
+            df_chunk = df.iloc[start:start + config.EXPORT_CHUNK_ROWS].astype(object)
+            df_chunk = df_chunk.where(df_chunk.notna(), None)
+            for index, *values in df_chunk.itertuples(name=None):
+                worksheet.write_row(row_number, 0, [index, *values])
+                row_number += 1
+        workbook.close()
+
+
+
+# --------------------------------------------------------------------------------
+# Class PendingExtraction
+# --------------------------------------------------------------------------------
+class PendingExtraction:
+    """
+    Facts extracted from an utterance and not committed yet, as a handle owned by a single caller 
+    (e.g., a user session). Many extractions can be pending on the same engine, each committed or 
+    cancelled on its own.
+    """
+    def __init__(self, engine, facts_utterance):
+        self._engine = engine
+        self.facts_utterance = facts_utterance
+        self.fact_tuples = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def extract(self):
+        """
+        Extracts the facts of the utterance.
+
+        Returns:
+            A list of tuples (category, type, people, key, value).
+        """
+        self.fact_tuples = self._engine._extract_fact_tuples(self.facts_utterance)
+        return self.fact_tuples
+
+    def stream(self):
+        """
+        Extracts the facts of the utterance, yielding each fact as soon as the GPT-3 model has 
+        completed its line.
+
+        Yields:
+            The tuples (category, type, people, key, value), in order.
+
+        Note:
+            The facts are only available to `commit` once the generator is exhausted.
+        """
+        fact_tuples = []
+        for fact_tuple in self._engine._extract_fact_tuples_stream(self.facts_utterance):
+            fact_tuples.append(fact_tuple)
+            yield fact_tuple
+        self.fact_tuples = fact_tuples
+
+    def has_extracted_facts(self):
+        """
+        Checks if facts have been extracted, and neither committed nor cancelled.
+        """
+        return self.fact_tuples is not None and not self._closed
+
+    def extracted_facts(self):
+        """
+        Returns the extracted facts as a list of dictionaries.
+
+        Returns:
+            A list of dictionaries representing the extracted facts.
+        """
+        return [{"Category": fact[0], "Type": fact[1], "People": fact[2], "Key": fact[3], "Value": fact[4]} 
+                 for fact in self.fact_tuples]
+
+    def commit(self, confirmed=False):
+        """
+        Commits the extracted facts to the database.
+
+        Parameters:
+            confirmed (bool, optional): Flag to indicate that the user checked the extracted facts, in 
+                which case they become an example for the extraction of similar utterances. Default is 
+                False.
+
+        Returns:
+            dict: The numbers of facts "inserted", and of "duplicates" and "merged" near-duplicates 
+            dropped, as returned by `Engine._insert_facts`, or None if there was nothing to commit.
+
+        Note:
+            If no facts have been extracted, or they were already committed or cancelled, the function 
+                logs a message indicating that there is nothing to commit.
+        """
+        with self._lock:
+            if not self.has_extracted_facts():
+                logging.info("Nothing to commit.")
+                return None
+            counts = self._engine._commit_facts(self.fact_tuples, self.facts_utterance, confirmed)
+            self._closed = True
+            return counts
+
+    def cancel(self):
+        """
+        Cancels the extracted facts.
+        """
+        with self._lock:
+            if not self.has_extracted_facts():
+                logging.info("Nothing to revert.")
+                return
+            self._closed = True
+
 
 
 # --------------------------------------------------------------------------------
 # Class Preprocessor
 # --------------------------------------------------------------------------------
+# words ignored when extracting the terms of short keyword queries locally
+STOPWORDS = {"a", "an", "and", "are", "as", "at", "be", "by", "did", "do", "does", "for", "from", "had", "has", 
+             "have", "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "our", "that", "the", "their", 
+             "this", "to", "was", "we", "were", "what", "when", "where", "which", "who", "why", "with", "you", 
+             "your"}
+
+
 class Preprocessor:
     """
     Preprocessor for the user input to GPT-3. Notably, includes the mechanisms to build prompts.
     """
-    def extraction_prompt(self, x, categories):
+    def extraction_prompt(self, x, categories, examples=None):
         """
         Generates an extraction prompt for extracting pieces of personal information.
 
         Parameters:
             x (str): The input sentence or text.
             categories (list): A list of allowed categories.
+            examples (list, optional): The few-shot examples, as (input, output) pairs. Default is None 
+                (all the built-in examples).
 
         Returns:
             str: The generated extraction prompt.
         """
+        if examples is None:
+            examples = BUILTIN_EXAMPLES
+        examples_text = "\n\n".join(f"Example input: {example_input}\nExample output: {example_output}"
+                                    for example_input, example_output in examples)
         prompt = \
 f"""
 You are tasked with extracting pieces of personal information from various inputs, such as phone numbers, email addresses, names, trivia, reminders, etc. Your goal is to extract and categorize these pieces of information into structured tuples.
@@ -428,36 +1474,12 @@ Constraints:
   - Allowed Types: "List", "Email", "Phone", "Address", "Document", "Pendency", "Price", "Reminder", "Note", "Doubt", "Wish", "Other"
   - People contain the name or description of the people or organizations concerned, or is empty if no person or organization is mentioned.
   
-Example input: "Mom's phone number is 555-555-5555"
-Example output: ("Family", "Phone", "mom", "mom's number", "555-555-5555")
-
-Example input: "email of the building administration = adm@example.com"
-Example output: ("Work", "Email", "building administration", "email", "adm@example.com")
-
-Example input: "Need to do: lab work, ultrasound, buy aspirin"
-Example output: 
-("Health", "List", "Self", "to do", "lab work")
-("Health", "List", "Self", "to do", "ultrasound")
-("Shopping", "List", "Self", "aspirin", "buy")	
-
-Example input: event support: we failed :-(
-Example output: 
-("Other", "Note", "event support", "failed", "we failed :-(")
-
-Example input: first aid kit in the reception
-Example output:
-("Home", "Note", "", "first aid kit", "reception")
-
-Example input: december receipts for gym: yoga, ballet, ??
-Example output:
-("Finance", "Document", "gym", "december receipts", "yoga")
-("Finance", "Document", "gym", "december receipts", "ballet")
-("Finance", "Document", "gym", "december receipts", "??")
+{examples_text}
 
 Input: {x}
 Output: 
 """
-        logging.info(f"GPT-3 Prompt: {prompt}")
+        log_payload("GPT-3 Prompt", prompt)
         return prompt 
 
     def terms_extraction_prompt(self, query):
@@ -474,9 +1496,26 @@ Output:
 f"""
 Extract the main entities (one per line, without bullets) in the following sentence: "{query}"
 """
-        logging.info(f"GPT-3 Prompt: {prompt}")
+        log_payload("GPT-3 Prompt", prompt)
         return prompt
 
+    def local_terms(self, query):
+        """
+        Extracts the terms of a short keyword query without GPT-3, as its words minus the stopwords.
+
+        Parameters:
+            query (str): The input query.
+
+        Returns:
+            list: The terms of the query, in order and without duplicates.
+        """
+        terms = []
+        for word in query.split():
+            term = word.strip(string.punctuation)
+            if len(term) > 0 and term.lower() not in STOPWORDS and term not in terms:
+                terms.append(term)
+        return terms
+
     def terms_augmentation_prompt(self, term):
         """
         Generates a prompt for augmenting terms with synonyms.
@@ -492,7 +1531,7 @@ f"""
 List some synonyms for the following term: "{term}"
 Synonyms (one synonym per line):
 """
-        logging.info(f"GPT-3 Prompt: {prompt}")
+        log_payload("GPT-3 Prompt", prompt)
         return prompt
     
 
@@ -500,6 +1539,20 @@ Synonyms (one synonym per line):
 # --------------------------------------------------------------------------------
 # Class Postprocessor
 # --------------------------------------------------------------------------------
+# a fact tuple is exactly five single- or double-quoted strings, with an optional trailing comma
+FACT_TUPLE_FIELD = r"""\s*(?:"((?:[^"\\]|\\.)*)"|'((?:[^'\\]|\\.)*)')\s*"""
+FACT_TUPLE_PATTERN = re.compile(r"\(" + ",".join([FACT_TUPLE_FIELD] * 5) + r",?\s*\),?")
+ESCAPE_PATTERN = re.compile(r"\\(.)")
+ESCAPES = {"n": "\n", "t": "\t", "r": "\r"}
+
+
+def unescape(match):
+    """
+    Replaces a backslash escape sequence matched by `ESCAPE_PATTERN` with the character it stands for.
+    """
+    return ESCAPES.get(match.group(1), match.group(1))
+
+
 class Postprocessor:
     """
     Postprocessor for the GPT-3 raw outputs.
@@ -525,9 +1578,44 @@ class Postprocessor:
             s (str): The string to convert.
 
         Returns:
-            list: A list of Python tuples created from the input string.
+            list: A list of Python tuples created from the input string. Lines that are not valid fact 
+                tuples are skipped, see `parse_tuples`.
+        """
+        fact_tuples, rejected_lines = self.parse_tuples(s)
+        if len(rejected_lines) > 0:
+            logging.warning(f"Rejected lines that are not fact tuples: {rejected_lines}")
+        return fact_tuples
+
+    def parse_tuples(self, s):
+        """
+        Parses the fact tuples in a string, line by line, without evaluating it as Python code.
+
+        Parameters:
+            s (str): The string to parse, with one tuple of five quoted strings per line, e.g. 
+                ("Family", "Phone", "mom", "mom's number", "555-555-5555").
+
+        Returns:
+            tuple: A list of the parsed tuples, and a list of the (non-empty) lines that could not be 
+                parsed, such as a last line truncated by the maximum number of tokens.
         """
-        return [eval(s.strip()) for s in self.extract_lines_from_result(s)]
+        fact_tuples = []
+        rejected_lines = []
+        for line in self.extract_lines_from_result(s):
+            line = line.strip()
+            if len(line) == 0:
+                continue
+
+            match = FACT_TUPLE_PATTERN.fullmatch(line)
+            if match is None:
+                rejected_lines.append(line)
+                continue
+
+            # each field is either double-quoted (odd groups) or single-quoted (even groups)
+            groups = match.groups()
+            fields = [groups[i] if groups[i] is not None else groups[i + 1] for i in range(0, 10, 2)]
+            fact_tuples.append(tuple(ESCAPE_PATTERN.sub(unescape, field) if "\\" in field else field 
+                                     for field in fields))
+        return fact_tuples, rejected_lines
 
     def extract_terms_from_all_results(self, results):
         """
@@ -0,0 +1,154 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import json
+from src.logger import logging
+from src.vector_index import vectorize
+import numpy as np
+from pathlib import Path
+import threading
+
+
+# the examples the extraction prompt was written with, as (input, output) pairs
+BUILTIN_EXAMPLES = [
+    ('"Mom\'s phone number is 555-555-5555"',
+     '("Family", "Phone", "mom", "mom\'s number", "555-555-5555")'),
+    ('"email of the building administration = adm@example.com"',
+     '("Work", "Email", "building administration", "email", "adm@example.com")'),
+    ('"Need to do: lab work, ultrasound, buy aspirin"',
+     '\n("Health", "List", "Self", "to do", "lab work")\n("Health", "List", "Self", "to do", "ultrasound")\n'
+     '("Shopping", "List", "Self", "aspirin", "buy")'),
+    ('event support: we failed :-(',
+     '\n("Other", "Note", "event support", "failed", "we failed :-(")'),
+    ('first aid kit in the reception',
+     '\n("Home", "Note", "", "first aid kit", "reception")'),
+    ('december receipts for gym: yoga, ballet, ??',
+     '\n("Finance", "Document", "gym", "december receipts", "yoga")\n'
+     '("Finance", "Document", "gym", "december receipts", "ballet")\n'
+     '("Finance", "Document", "gym", "december receipts", "??")'),
+]
+
+
+def format_fact_tuple(fact_tuple):
+    """
+    Formats a fact as a tuple of double-quoted strings, as parsed by `Postprocessor.parse_tuples`.
+
+    Parameters:
+        fact_tuple (tuple): The fact (category, type, people, key, value).
+
+    Returns:
+        str: The formatted fact, with backslashes, quotes and line breaks escaped.
+    """
+    fields = []
+    for field in fact_tuple:
+        field = "" if field is None else str(field)
+        fields.append('"' + field.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"')
+    return f"({', '.join(fields)})"
+
+
+def estimated_tokens(text):
+    """
+    Estimates the number of tokens of a text, at about 4 characters per token.
+    """
+    return len(text) // 4 + 1
+
+
+
+# --------------------------------------------------------------------------------
+# Class ExampleStore
+# --------------------------------------------------------------------------------
+class ExampleStore:
+    """
+    Store of the few-shot examples of the extraction prompt: the built-in examples, plus the
+    extractions confirmed by the user, appended to a JSONL file. For each utterance, only the
+    examples most similar to it are put in the prompt, as measured by the cosine similarity of
+    their hashed character n-gram vectors.
+    """
+    def __init__(self, file_path, dimensions):
+        self._file_path = file_path
+        self._dimensions = dimensions
+        self._examples = list(BUILTIN_EXAMPLES)
+        self._inputs = {example_input for example_input, _ in self._examples}
+        # the vectors are only computed once examples are selected, then kept up to date
+        self._vectors = None
+        # the engine builds prompts from several threads (e.g., batched extraction)
+        self._lock = threading.Lock()
+
+        try:
+            with open(self._file_path, encoding="utf-8") as file:
+                for line in file:
+                    if len(line.strip()) > 0:
+                        record = json.loads(line)
+                        self._append(record["utterance"], record["facts"])
+            logging.info(f"Loaded {len(self._examples) - len(BUILTIN_EXAMPLES)} confirmed examples "
+                         f"from {self._file_path}.")
+        except FileNotFoundError:
+            pass
+
+    def _append(self, utterance, fact_tuples):
+        """
+        Appends an example in memory, unless its utterance is already an example.
+
+        Returns:
+            bool: True if the example was appended.
+        """
+        if utterance in self._inputs or len(fact_tuples) == 0:
+            return False
+        self._examples.append((utterance, "\n" + "\n".join(format_fact_tuple(fact_tuple) for fact_tuple in fact_tuples)))
+        self._inputs.add(utterance)
+        if self._vectors is not None:
+            self._vectors = np.vstack([self._vectors, vectorize([utterance], self._dimensions)])
+        return True
+
+    def add(self, utterance, fact_tuples):
+        """
+        Adds a confirmed extraction to the examples, and to the examples file.
+
+        Parameters:
+            utterance (str): The utterance the facts were extracted from.
+            fact_tuples (list): The facts, as tuples (category, type, people, key, value), as confirmed.
+        """
+        with self._lock:
+            if not self._append(utterance, fact_tuples):
+                return
+            os.makedirs(Path(self._file_path).parent, exist_ok=True)
+            with open(self._file_path, "a", encoding="utf-8") as file:
+                file.write(json.dumps({"utterance": utterance, "facts": [list(fact_tuple) for fact_tuple in fact_tuples]}) + "\n")
+
+    def select(self, utterance, max_examples, max_tokens):
+        """
+        Selects the examples most similar to an utterance.
+
+        Parameters:
+            utterance (str): The utterance to extract facts from.
+            max_examples (int): The maximum number of examples.
+            max_tokens (int): The maximum number of tokens of the examples, as estimated from their length.
+                The most similar example is always selected, less similar ones only if they fit.
+
+        Returns:
+            list: The examples, as (input, output) pairs, the most similar last, i.e., closest to the
+                utterance in the prompt.
+        """
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = vectorize([example_input for example_input, _ in self._examples], self._dimensions)
+            similarities = self._vectors @ vectorize([utterance], self._dimensions)[0]
+            # stable, so that equally similar examples keep their order, built-in ones first
+            order = np.argsort(-similarities, kind="stable")
+
+            selected_examples = []
+            total_tokens = 0
+            for i in order:
+                if len(selected_examples) == max_examples:
+                    break
+                example_input, example_output = self._examples[i]
+                tokens = estimated_tokens(example_input) + estimated_tokens(example_output)
+                if len(selected_examples) > 0 and total_tokens + tokens > max_tokens:
+                    continue
+                selected_examples.append((example_input, example_output))
+                total_tokens += tokens
+        return selected_examples[::-1]
+
+    def __len__(self):
+        return len(self._examples)
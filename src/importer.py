@@ -0,0 +1,202 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from config import config
+import csv
+from itertools import islice
+import json
+from src.engine import Engine
+from src.logger import logging
+from pathlib import Path
+import time
+
+
+def read_utterances(file_path, field="utterance"):
+    """
+    Reads the utterances of a corpus of notes.
+
+    Parameters:
+        file_path (str or Path): A ".jsonl" file with one string or object per line, a ".csv" file
+            with a header, or a text file with one utterance per line.
+        field (str, optional): The field of the objects, or the column of the CSV file, holding the
+            utterances. Default is "utterance".
+
+    Yields:
+        The non-empty utterances, in the order of the file.
+    """
+    suffix = Path(file_path).suffix.lower()
+    with open(file_path, newline="", encoding="utf-8") as file:
+        if suffix == ".csv":
+            utterances = (row[field] for row in csv.DictReader(file))
+        elif suffix == ".jsonl":
+            utterances = (record if isinstance(record, str) else record[field]
+                          for record in (json.loads(line) for line in file if len(line.strip()) > 0))
+        else:
+            utterances = (line.rstrip("\n") for line in file)
+
+        for utterance in utterances:
+            if utterance is not None and len(utterance.strip()) > 0:
+                yield utterance.strip()
+
+
+def batched(iterable, batch_size):
+    """
+    Splits an iterable into lists of at most `batch_size` items.
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if len(batch) == 0:
+            return
+        yield batch
+
+
+
+# --------------------------------------------------------------------------------
+# Class Checkpoint
+# --------------------------------------------------------------------------------
+class Checkpoint:
+    """
+    Progress of an import, saved after every committed batch so that an interrupted import resumes
+    after the last committed utterance.
+    """
+    def __init__(self, file_path, input_file_path):
+        self._file_path = file_path
+        self.input_file_path = str(Path(input_file_path).absolute())
+        self.committed_utterances = 0
+        self.committed_facts = 0
+        # facts dropped as duplicates, or merged into a close variant, of facts of the database
+        self.dropped_facts = 0
+        self.failures = []
+
+        if os.path.exists(self._file_path):
+            with open(self._file_path) as file:
+                state = json.load(file)
+            if state["input_file_path"] != self.input_file_path:
+                raise ValueError(f"Checkpoint {self._file_path} belongs to the import of {state['input_file_path']}.")
+            self.committed_utterances = state["committed_utterances"]
+            self.committed_facts = state["committed_facts"]
+            self.dropped_facts = state.get("dropped_facts", 0)
+            self.failures = state["failures"]
+
+    def save(self):
+        """
+        Writes the checkpoint, replacing the previous one atomically.
+        """
+        temporary_file_path = f"{self._file_path}.tmp"
+        with open(temporary_file_path, "w") as file:
+            json.dump({"input_file_path": self.input_file_path, "committed_utterances": self.committed_utterances,
+                       "committed_facts": self.committed_facts, "dropped_facts": self.dropped_facts,
+                       "failures": self.failures}, file, indent=2)
+        os.replace(temporary_file_path, self._file_path)
+
+
+
+def import_utterances(engine, utterances, checkpoint, batch_size, workers):
+    """
+    Extracts the facts of utterances with a pool of workers and commits them batch by batch.
+
+    Parameters:
+        engine (Engine): The engine, whose database receives the facts.
+        utterances (iterable): The utterances, including the ones committed before the checkpoint.
+        checkpoint (Checkpoint): The progress of the import, updated and saved after every commit.
+        batch_size (int): The number of utterances extracted with a single GPT-3 request, and
+            committed with a single write.
+        workers (int): The number of batches extracted concurrently.
+
+    Returns:
+        The error that interrupted the import, or None if all the utterances were imported.
+
+    Note:
+        Batches are committed in the order of the utterances, so that the checkpoint only needs the
+            number of committed utterances. Utterances whose completion could not be entirely parsed
+            are committed with the facts that could, and recorded as failures. A failed GPT-3 request
+            (e.g., rate limits exceeded past the deadline) stops the import at the last committed
+            batch, and its utterances are extracted again when the import is resumed.
+    """
+    batches = batched(islice(utterances, checkpoint.committed_utterances, None), batch_size)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        def submit_next():
+            batch = next(batches, None)
+            if batch is not None:
+                pending.append(executor.submit(engine.extract_facts_many, batch, batch_size=batch_size,
+                                               raise_errors=True))
+
+        # a few batches ahead of the workers, so that they never wait, without reading the whole corpus
+        for _ in range(2 * workers):
+            submit_next()
+
+        while len(pending) > 0:
+            try:
+                results = pending.popleft().result()
+            except Exception as e:
+                logging.error(f"Import interrupted after {checkpoint.committed_utterances} utterances: {e}")
+                for future in pending:
+                    future.cancel()
+                return e
+
+            counts = engine.commit_many(results)
+            checkpoint.committed_facts += counts["inserted"]
+            checkpoint.dropped_facts += counts["duplicates"] + counts["merged"]
+            for result in results:
+                if result["error"] is not None:
+                    checkpoint.failures.append({"index": checkpoint.committed_utterances,
+                                                "utterance": result["utterance"], "error": result["error"]})
+                checkpoint.committed_utterances += 1
+            checkpoint.save()
+            submit_next()
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Imports the facts of a corpus of notes into the database.")
+    parser.add_argument("input", help="JSONL, CSV or text file with the utterances")
+    parser.add_argument("--field", default="utterance", help="field of the JSONL objects or column of the CSV file "
+                                                            "holding the utterances")
+    parser.add_argument("--batch-size", type=int, default=config.EXTRACTION_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=config.IMPORT_WORKERS)
+    parser.add_argument("--checkpoint", help="checkpoint file, next to the input by default")
+    parser.add_argument("--storage-backend", choices=["csv", "sqlite"], default=config.STORAGE_BACKEND)
+    args = parser.parse_args()
+
+    checkpoint = Checkpoint(args.checkpoint or f"{args.input}.checkpoint.json", args.input)
+    if checkpoint.committed_utterances > 0:
+        print(f"Resuming after {checkpoint.committed_utterances} utterances.", file=sys.stderr)
+    committed_utterances, committed_facts, dropped_facts, failures = (checkpoint.committed_utterances,
+                                                                      checkpoint.committed_facts,
+                                                                      checkpoint.dropped_facts,
+                                                                      len(checkpoint.failures))
+
+    engine = Engine(storage_backend=args.storage_backend)
+    start = time.perf_counter()
+    error = import_utterances(engine, read_utterances(args.input, args.field), checkpoint, args.batch_size,
+                              args.workers)
+    elapsed_seconds = time.perf_counter() - start
+
+    utterances = checkpoint.committed_utterances - committed_utterances
+    facts = checkpoint.committed_facts - committed_facts
+    counters = engine.metrics.snapshot()["counters"]
+    print(json.dumps({"utterances": utterances,
+                      "facts": facts,
+                      "dropped_facts": checkpoint.dropped_facts - dropped_facts,
+                      "failed_utterances": len(checkpoint.failures) - failures,
+                      "elapsed_seconds": elapsed_seconds,
+                      "utterances_per_second": utterances / elapsed_seconds if elapsed_seconds > 0 else None,
+                      "facts_per_second": facts / elapsed_seconds if elapsed_seconds > 0 else None,
+                      "api_requests": counters.get("api_requests", 0),
+                      "prompt_tokens": counters.get("prompt_tokens", 0),
+                      "completion_tokens": counters.get("completion_tokens", 0),
+                      "total_committed_utterances": checkpoint.committed_utterances,
+                      "error": None if error is None else str(error)}, indent=2))
+    if error is not None:
+        print("Run the same command again to resume the import.", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
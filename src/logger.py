@@ -1,18 +1,79 @@
 from config import config
-from datetime import datetime
+import atexit
 import logging
+import logging.handlers
 import os
 from pathlib import Path
+import queue
+import random
+import re
+import sys
 
 
-LOG_FILE = f"{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}.log"
-logs_path = Path(config.LOG_DIR, LOG_FILE)
-os.makedirs(logs_path, exist_ok=True)
+def _process_role():
+    """
+    Returns the role of the process, which names its log file: the SLICEMATE_LOG_ROLE environment 
+    variable if set, else the name of the script being run, e.g., "server" or "importer", or "app" 
+    for the Streamlit app.
+    """
+    role = os.environ.get("SLICEMATE_LOG_ROLE")
+    if not role:
+        script = Path(sys.argv[0]).stem if len(sys.argv) > 0 else ""
+        role = "app" if script == "streamlit" else script if script not in ["", "-c", "-m"] else "python"
+    return re.sub(r"[^\w.-]", "_", role)
 
-LOG_FILE_PATH = os.path.join(logs_path, LOG_FILE)
 
-logging.basicConfig(
-    filename=LOG_FILE_PATH,
-    format="[ %(asctime)s ] %(lineno)d %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
-)
\ No newline at end of file
+# each role (app, server, importer) rotates its own file, as rotating a file shared by several 
+# processes would lose or interleave records; processes of the same role running at once should 
+# set SLICEMATE_LOG_ROLE apart
+LOG_FILE_PATH = Path(config.LOG_DIR, config.LOG_FILE_NAME.format(role=_process_role()))
+os.makedirs(config.LOG_DIR, exist_ok=True)
+
+
+def _configure():
+    """
+    Sends the log records through a queue to a background thread, which writes them to the log
+    file of the role of the process, rotated by size, so that no log I/O happens on the threads serving requests.
+
+    Note:
+        The records are formatted when they are queued, and the queue is flushed at exit.
+    """
+    root_logger = logging.getLogger()
+    if any(isinstance(handler, logging.handlers.QueueHandler) for handler in root_logger.handlers):
+        return
+
+    file_handler = logging.handlers.RotatingFileHandler(LOG_FILE_PATH, maxBytes=config.LOG_MAX_BYTES,
+                                                        backupCount=config.LOG_BACKUP_COUNT,
+                                                        encoding="utf-8", delay=True)
+    # the process id is kept in the records, so that the files of several processes can be merged
+    file_handler.setFormatter(logging.Formatter(
+        "[ %(asctime)s ] %(process)d %(lineno)d %(name)s - %(levelname)s - %(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    root_logger.setLevel(config.LOG_LEVEL)
+
+
+def log_payload(title, payload):
+    """
+    Logs a large payload, e.g., a GPT-3 prompt or completion, at DEBUG level or, for a sample of
+    them, at INFO level.
+
+    Parameters:
+        title (str): What the payload is, e.g., "GPT-3 Prompt".
+        payload (str): The payload.
+
+    Note:
+        The share of the payloads logged at INFO level is `config.LOG_PAYLOAD_SAMPLE_RATE`.
+    """
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(f"{title}: {payload}")
+    elif random.random() < config.LOG_PAYLOAD_SAMPLE_RATE:
+        logging.info(f"{title} (sampled): {payload}")
+
+
+_configure()
@@ -0,0 +1,267 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from bisect import bisect_left
+from contextlib import contextmanager
+import json
+from src.logger import logging
+from pathlib import Path
+import threading
+import time
+
+
+METRICS_PREFIX = "slicemate"
+
+
+
+# --------------------------------------------------------------------------------
+# Class Histogram
+# --------------------------------------------------------------------------------
+class Histogram:
+    """
+    Histogram of observed values, counted in fixed buckets as Prometheus does.
+    """
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        # one count per bucket, plus one for the values above the last bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        """
+        Counts a value in its bucket.
+
+        Parameters:
+            value (float): The observed value.
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def cumulative_counts(self):
+        """
+        Returns the number of values less than or equal to each bucket bound, then the total count.
+        """
+        cumulative_counts = []
+        total = 0
+        for count in self.counts:
+            total += count
+            cumulative_counts.append(total)
+        return cumulative_counts
+
+    def quantile(self, q):
+        """
+        Estimates a quantile of the observed values, as the upper bound of the bucket it falls in.
+
+        Parameters:
+            q (float): The quantile, between 0 and 1.
+
+        Returns:
+            float: The estimated quantile, the maximum observed value if it falls above the last
+                bucket, or None if no value has been observed.
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        for bound, cumulative_count in zip(self.buckets, self.cumulative_counts()):
+            if cumulative_count >= rank:
+                return bound
+        return self.max
+
+
+
+# --------------------------------------------------------------------------------
+# Class Metrics
+# --------------------------------------------------------------------------------
+class Metrics:
+    """
+    Structured instrumentation of the engine: latency histograms of its stages, counters (e.g.,
+    tokens used) and gauges read when exported (e.g., database size). They can be exported in the
+    Prometheus text format or as a JSON snapshot, and profiling hooks registered by callers are
+    called at the end of every stage.
+    """
+    def __init__(self, latency_buckets_seconds):
+        self._latency_buckets_seconds = latency_buckets_seconds
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._hooks = []
+        # stages run concurrently, e.g., the API calls of the augmentation threads
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times a stage of the engine, e.g., `with metrics.stage("parse"): ...`.
+
+        Parameters:
+            name (str): The name of the stage.
+
+        Note:
+            The duration is recorded even if the stage raises an exception.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def observe(self, name, seconds):
+        """
+        Records the duration of a stage and calls the profiling hooks.
+
+        Parameters:
+            name (str): The name of the stage.
+            seconds (float): The duration of the stage, in seconds.
+        """
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram(self._latency_buckets_seconds)
+            self._histograms[name].observe(seconds)
+            hooks = list(self._hooks)
+
+        for hook in hooks:
+            try:
+                hook(name, seconds)
+            except Exception as e:
+                logging.warning(f"Profiling hook {hook} failed: {e}")
+
+    def increment(self, name, amount=1):
+        """
+        Increments a counter.
+
+        Parameters:
+            name (str): The name of the counter.
+            amount (float, optional): The amount to add. Default is 1.
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def register_gauge(self, name, function):
+        """
+        Registers a gauge, whose value is read when the metrics are exported.
+
+        Parameters:
+            name (str): The name of the gauge.
+            function (callable): A function without arguments returning the current value, or None
+                if it is not available.
+        """
+        with self._lock:
+            self._gauges[name] = function
+
+    def register_hook(self, hook):
+        """
+        Registers a profiling hook, called at the end of every stage.
+
+        Parameters:
+            hook (callable): A function called with the name of the stage and its duration in seconds.
+                It is called from the thread that ran the stage, so it should be quick and thread-safe.
+        """
+        with self._lock:
+            self._hooks.append(hook)
+
+    def unregister_hook(self, hook):
+        """
+        Unregisters a profiling hook.
+
+        Parameters:
+            hook (callable): A hook previously registered with `register_hook`.
+        """
+        with self._lock:
+            self._hooks.remove(hook)
+
+    def _gauge_values(self):
+        """
+        Reads the current values of the gauges, skipping the unavailable ones.
+        """
+        with self._lock:
+            gauges = dict(self._gauges)
+
+        values = {}
+        for name, function in gauges.items():
+            try:
+                value = function()
+            except Exception as e:
+                logging.warning(f"Could not read gauge {name}: {e}")
+                continue
+            if value is not None:
+                values[name] = value
+        return values
+
+    def snapshot(self):
+        """
+        Returns a snapshot of all the metrics.
+
+        Returns:
+            dict: The "stages" (count, total, mean, median, 95th percentile and maximum durations in
+                seconds, and the bucket counts of each stage), "counters" and "gauges", with a "timestamp".
+        """
+        gauges = self._gauge_values()
+        with self._lock:
+            stages = {name: {"count": histogram.count,
+                             "total_seconds": histogram.sum,
+                             "mean_seconds": histogram.sum / histogram.count if histogram.count > 0 else None,
+                             "p50_seconds": histogram.quantile(0.5),
+                             "p95_seconds": histogram.quantile(0.95),
+                             "max_seconds": histogram.max,
+                             "buckets": {str(bound): count for bound, count
+                                         in zip(histogram.buckets + ("+Inf",), histogram.cumulative_counts())}}
+                      for name, histogram in self._histograms.items()}
+            counters = dict(self._counters)
+        return {"timestamp": time.time(), "stages": stages, "counters": counters, "gauges": gauges}
+
+    def to_prometheus(self):
+        """
+        Returns all the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The stage durations as the histogram `slicemate_stage_duration_seconds` labelled by
+                stage, the counters as `slicemate_<name>_total` and the gauges as `slicemate_<name>`.
+        """
+        gauges = self._gauge_values()
+        lines = []
+        with self._lock:
+            histogram_name = f"{METRICS_PREFIX}_stage_duration_seconds"
+            lines += [f"# HELP {histogram_name} Duration of the engine stages.",
+                      f"# TYPE {histogram_name} histogram"]
+            for name, histogram in sorted(self._histograms.items()):
+                for bound, count in zip(histogram.buckets + ("+Inf",), histogram.cumulative_counts()):
+                    lines.append(f'{histogram_name}_bucket{{stage="{name}",le="{bound}"}} {count}')
+                lines.append(f'{histogram_name}_sum{{stage="{name}"}} {histogram.sum}')
+                lines.append(f'{histogram_name}_count{{stage="{name}"}} {histogram.count}')
+
+            for name, value in sorted(self._counters.items()):
+                lines += [f"# TYPE {METRICS_PREFIX}_{name}_total counter",
+                          f"{METRICS_PREFIX}_{name}_total {value}"]
+
+        for name, value in sorted(gauges.items()):
+            lines += [f"# TYPE {METRICS_PREFIX}_{name} gauge",
+                      f"{METRICS_PREFIX}_{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def export(self, file_path):
+        """
+        Writes all the metrics to a file, e.g., for a Prometheus node exporter's textfile collector.
+
+        Parameters:
+            file_path (str or Path): The file to write. A ".json" file gets a JSON snapshot, any other
+                file the Prometheus text format.
+
+        Note:
+            The file is written next to its destination then moved over it, so that a collector never
+                reads a partially written file.
+        """
+        if Path(file_path).suffix == ".json":
+            content = json.dumps(self.snapshot(), indent=2)
+        else:
+            content = self.to_prometheus()
+
+        os.makedirs(Path(file_path).parent, exist_ok=True)
+        tmp_file_path = f"{file_path}.tmp"
+        with open(tmp_file_path, "w") as file:
+            file.write(content)
+        os.replace(tmp_file_path, file_path)
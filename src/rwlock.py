@@ -0,0 +1,63 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from contextlib import contextmanager
+import threading
+
+
+
+# --------------------------------------------------------------------------------
+# Class ReadWriteLock
+# --------------------------------------------------------------------------------
+class ReadWriteLock:
+    """
+    Lock letting many readers, or a single writer, in at once. Once a writer is waiting, new
+    readers wait behind it, so that a steady flow of readers cannot starve the writers.
+
+    Note:
+        The lock is not reentrant: a thread holding it must not acquire it again, for reading or
+            writing, or it may deadlock with a waiting writer.
+    """
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        """
+        Holds the lock for reading, e.g., `with lock.read(): ...`.
+        """
+        with self._condition:
+            while self._writing or self._waiting_writers > 0:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        """
+        Holds the lock for writing, e.g., `with lock.write(): ...`.
+        """
+        with self._condition:
+            self._waiting_writers += 1
+            try:
+                while self._writing or self._readers > 0:
+                    self._condition.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
@@ -0,0 +1,239 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import asyncio
+from src.logger import logging
+import openai
+import random
+import threading
+import time
+
+
+# errors worth retrying: rate limits, overloaded or unreachable servers and timeouts
+RETRYABLE_ERRORS = (openai.error.RateLimitError, openai.error.APIConnectionError, openai.error.Timeout,
+                    openai.error.ServiceUnavailableError, openai.error.TryAgain)
+
+
+
+# --------------------------------------------------------------------------------
+# Class TokenBucket
+# --------------------------------------------------------------------------------
+class TokenBucket:
+    """
+    Token bucket limiting the rate of a resource (requests, tokens) per minute, allowing bursts
+    up to a minute's worth of it.
+    """
+    def __init__(self, rate_per_minute):
+        self._capacity = float(rate_per_minute)
+        self._available = float(rate_per_minute)
+        self._refill_per_second = rate_per_minute / 60.0
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount, deadline):
+        """
+        Takes an amount from the bucket, waiting until it has been refilled enough.
+
+        Parameters:
+            amount (float): The amount to take, capped to the capacity of the bucket.
+            deadline (float): The `time.monotonic()` time after which to give up.
+
+        Raises:
+            TimeoutError: If the amount would only be available after the deadline.
+        """
+        while True:
+            wait_seconds = self._take(amount, deadline)
+            if wait_seconds == 0:
+                return
+            time.sleep(wait_seconds)
+
+    async def acquire_async(self, amount, deadline):
+        """
+        Takes an amount from the bucket, like `acquire`, but waits without blocking the event loop.
+        """
+        while True:
+            wait_seconds = self._take(amount, deadline)
+            if wait_seconds == 0:
+                return
+            await asyncio.sleep(wait_seconds)
+
+    def _take(self, amount, deadline):
+        """
+        Takes an amount from the bucket if it is available.
+
+        Returns:
+            float: 0 if the amount was taken, otherwise how long to wait before it may be available.
+
+        Raises:
+            TimeoutError: If the amount would only be available after the deadline.
+        """
+        amount = min(amount, self._capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._available = min(self._capacity, self._available + (now - self._last_refill) * self._refill_per_second)
+            self._last_refill = now
+            if self._available >= amount:
+                self._available -= amount
+                return 0
+            wait_seconds = (amount - self._available) / self._refill_per_second
+
+        if now + wait_seconds > deadline:
+            raise TimeoutError("Rate limit would be exceeded before the deadline.")
+        return wait_seconds
+
+
+
+# --------------------------------------------------------------------------------
+# Class RequestScheduler
+# --------------------------------------------------------------------------------
+class RequestScheduler:
+    """
+    Client-side scheduler of the GPT-3 API requests. It keeps the requests and tokens per minute
+    under the account's limits, bounds the number of requests in flight, retries the transient
+    failures with jittered exponential backoff and enforces a deadline on every call.
+    """
+    def __init__(self, requests_per_minute, tokens_per_minute, max_in_flight, max_retries,
+                 backoff_base_seconds, backoff_max_seconds, deadline_seconds):
+        self._requests_bucket = TokenBucket(requests_per_minute)
+        self._tokens_bucket = TokenBucket(tokens_per_minute)
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._max_retries = max_retries
+        self._backoff_base_seconds = backoff_base_seconds
+        self._backoff_max_seconds = backoff_max_seconds
+        self._deadline_seconds = deadline_seconds
+
+    def call(self, function, estimated_tokens, **kwargs):
+        """
+        Calls an OpenAI API function under the rate limits, retrying it on transient errors.
+
+        Parameters:
+            function (callable): The API function, e.g., `openai.Completion.create`.
+            estimated_tokens (int): The number of tokens the request is expected to use.
+            **kwargs: The arguments of the API function. A `request_timeout` is added so that the
+                request does not outlive the deadline of the call.
+
+        Returns:
+            The response of the API function.
+
+        Raises:
+            TimeoutError: If the deadline passes before a request could succeed.
+            openai.error.OpenAIError: If the request fails with a non-transient error, or still fails
+                after all the retries.
+        """
+        deadline = time.monotonic() + self._deadline_seconds
+        for attempt in range(self._max_retries + 1):
+            self._requests_bucket.acquire(1, deadline)
+            self._tokens_bucket.acquire(estimated_tokens, deadline)
+
+            if not self._in_flight.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                raise TimeoutError("Too many requests in flight to complete before the deadline.")
+            try:
+                remaining_seconds = deadline - time.monotonic()
+                if remaining_seconds <= 0:
+                    raise TimeoutError("Deadline exceeded before the request could be sent.")
+                return function(request_timeout=remaining_seconds, **kwargs)
+            except openai.error.OpenAIError as e:
+                if not self._is_retryable(e):
+                    raise
+                error = e
+            finally:
+                self._in_flight.release()
+
+            if attempt == self._max_retries:
+                break
+            backoff_seconds = self._backoff_seconds(attempt, error)
+            if time.monotonic() + backoff_seconds > deadline:
+                break
+            logging.warning(f"GPT-3 request failed ({error}), retrying in {backoff_seconds:.2f} seconds.")
+            time.sleep(backoff_seconds)
+
+        raise error
+
+    async def call_async(self, function, estimated_tokens, in_flight, **kwargs):
+        """
+        Calls an asynchronous OpenAI API function under the rate limits, retrying it on transient 
+        errors, like `call` but without blocking the event loop.
+
+        Parameters:
+            function (callable): The asynchronous API function, e.g., `openai.Completion.acreate`.
+            estimated_tokens (int): The number of tokens the request is expected to use.
+            in_flight (asyncio.Semaphore): The semaphore bounding the requests in flight on the event loop.
+            **kwargs: The arguments of the API function.
+
+        Returns:
+            The response of the API function.
+
+        Raises:
+            TimeoutError: If the deadline passes before a request could succeed.
+            openai.error.OpenAIError: If the request fails with a non-transient error, or still fails
+                after all the retries.
+
+        Note:
+            The requests and tokens per minute are shared with the synchronous calls.
+        """
+        deadline = time.monotonic() + self._deadline_seconds
+        for attempt in range(self._max_retries + 1):
+            await self._requests_bucket.acquire_async(1, deadline)
+            await self._tokens_bucket.acquire_async(estimated_tokens, deadline)
+
+            try:
+                await asyncio.wait_for(in_flight.acquire(), timeout=max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                raise TimeoutError("Too many requests in flight to complete before the deadline.")
+            try:
+                remaining_seconds = deadline - time.monotonic()
+                if remaining_seconds <= 0:
+                    raise TimeoutError("Deadline exceeded before the request could be sent.")
+                return await function(request_timeout=remaining_seconds, **kwargs)
+            except openai.error.OpenAIError as e:
+                if not self._is_retryable(e):
+                    raise
+                error = e
+            finally:
+                in_flight.release()
+
+            if attempt == self._max_retries:
+                break
+            backoff_seconds = self._backoff_seconds(attempt, error)
+            if time.monotonic() + backoff_seconds > deadline:
+                break
+            logging.warning(f"GPT-3 request failed ({error}), retrying in {backoff_seconds:.2f} seconds.")
+            await asyncio.sleep(backoff_seconds)
+
+        raise error
+
+    @staticmethod
+    def _is_retryable(error):
+        """
+        Checks if a failed request is worth retrying.
+
+        Parameters:
+            error (openai.error.OpenAIError): The error of the request.
+
+        Returns:
+            bool: True for rate limits, timeouts, unreachable or overloaded servers and server errors.
+        """
+        if isinstance(error, RETRYABLE_ERRORS):
+            return True
+        # other API errors are only transient when the server failed
+        return isinstance(error, openai.error.APIError) and (error.http_status is None or error.http_status >= 500)
+
+    def _backoff_seconds(self, attempt, error):
+        """
+        Computes how long to wait before retrying a failed request.
+
+        Parameters:
+            attempt (int): The number of the failed attempt, starting at 0.
+            error (Exception): The error of the failed attempt.
+
+        Returns:
+            float: The server's Retry-After delay if it sent one, otherwise a random delay up to an
+                exponentially growing bound ("full jitter"), so that clients do not retry in lockstep.
+        """
+        headers = getattr(error, "headers", None) or {}
+        try:
+            return min(float(headers.get("retry-after")), self._backoff_max_seconds)
+        except (TypeError, ValueError):
+            pass
+        return random.uniform(0, min(self._backoff_max_seconds, self._backoff_base_seconds * 2 ** attempt))
@@ -0,0 +1,420 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import argparse
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from config import config
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from src.engine import Engine
+from src.logger import logging
+import queue
+import threading
+import time
+import uuid
+
+
+EXPORT_CONTENT_TYPES = {"csv": "text/csv", "tsv": "text/tab-separated-values",
+                        "excel": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                        "parquet": "application/vnd.apache.parquet",
+                        "arrow": "application/vnd.apache.arrow.file"}
+
+
+
+# --------------------------------------------------------------------------------
+# Class MicroBatcher
+# --------------------------------------------------------------------------------
+class MicroBatcher:
+    """
+    Coalesces the extraction requests arriving within a short window into a single multi-prompt
+    GPT-3 request, then hands each caller the facts of its own utterance.
+    """
+    def __init__(self, engine, max_batch_size, max_wait_seconds, max_batches_in_flight):
+        self._engine = engine
+        self._max_batch_size = max_batch_size
+        self._max_wait_seconds = max_wait_seconds
+        self._queue = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_batches_in_flight)
+        self._closed = threading.Event()
+
+        engine.metrics.register_gauge("extraction_queue_depth", self.queue_depth)
+        self._dispatcher = threading.Thread(target=self._dispatch, name="MicroBatcher", daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, facts_utterance):
+        """
+        Queues an utterance for extraction.
+
+        Parameters:
+            facts_utterance (str): The natural language utterance from which to extract facts.
+
+        Returns:
+            concurrent.futures.Future: The future result of the extraction, a dictionary with the keys
+            "utterance", "facts" and "error", as returned by `Engine.extract_facts_many`.
+        """
+        future = Future()
+        self._queue.put((facts_utterance, future, time.perf_counter()))
+        return future
+
+    def queue_depth(self):
+        """
+        Returns the number of utterances waiting to be batched.
+        """
+        return self._queue.qsize()
+
+    def close(self):
+        """
+        Stops batching, once the batches in flight are done.
+        """
+        self._closed.set()
+        self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+
+    def _dispatch(self):
+        """
+        Collects the queued utterances into batches, each closed once full or once its first
+        utterance has waited `max_wait_seconds`, and sends them to the worker threads.
+        """
+        while not self._closed.is_set():
+            try:
+                batch = [self._queue.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+
+            deadline = time.perf_counter() + self._max_wait_seconds
+            while len(batch) < self._max_batch_size:
+                remaining_seconds = deadline - time.perf_counter()
+                if remaining_seconds <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining_seconds))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._extract, batch)
+
+    def _extract(self, batch):
+        """
+        Extracts the facts of a batch of utterances with a single request, and resolves their futures.
+        """
+        now = time.perf_counter()
+        for _, _, queued_at in batch:
+            self._engine.metrics.observe("batch_wait", now - queued_at)
+        self._engine.metrics.increment("extraction_batches")
+        self._engine.metrics.increment("extraction_batched_utterances", len(batch))
+
+        try:
+            results = self._engine.extract_facts_many([facts_utterance for facts_utterance, _, _ in batch],
+                                                      batch_size=len(batch), raise_errors=True)
+        except Exception as e:
+            logging.warning(f"Could not extract facts from a batch of {len(batch)} utterances: {e}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
+
+
+
+# --------------------------------------------------------------------------------
+# Class FactServer
+# --------------------------------------------------------------------------------
+class FactServer(ThreadingHTTPServer):
+    """
+    HTTP/JSON server exposing the extraction, commit, query and export of facts of an engine.
+    Each request is served by its own thread, and the extraction requests are micro-batched.
+
+    Endpoints:
+        POST /extract {"utterance"} -> {"extraction_id", "facts", "error"}
+        POST /commit {"extraction_id", "confirmed"} -> {"committed_facts", "duplicate_facts", "merged_facts"}
+        POST /cancel {"extraction_id"} -> {}
+        POST /query {"query", "categories", "entry_types", "people", "offset", "limit", "search_mode"}
+            -> {"total_results", "facts"}
+        POST /export {the fields of /query, "file_type"} -> the file, streamed for CSV and TSV
+        GET /metrics -> the metrics of the engine, in the Prometheus text format
+        GET /health -> {"facts"}
+    """
+    daemon_threads = True
+    # bursts of clients, e.g., many extractions coalesced into a batch, must not overflow the listen backlog
+    request_queue_size = 128
+
+    def __init__(self, server_address, engine, max_batch_size=config.SERVER_MAX_BATCH_SIZE,
+                 max_wait_seconds=config.SERVER_MAX_WAIT_SECONDS,
+                 max_batches_in_flight=config.SERVER_MAX_BATCHES_IN_FLIGHT):
+        super().__init__(server_address, RequestHandler)
+        self.engine = engine
+        self.batcher = MicroBatcher(engine, max_batch_size, max_wait_seconds, max_batches_in_flight)
+
+        # extractions waiting to be committed or cancelled, the oldest ones dropped past the limit
+        self._pending_extractions = OrderedDict()
+        self._pending_extractions_lock = threading.Lock()
+        engine.metrics.register_gauge("pending_extractions", lambda: len(self._pending_extractions))
+
+    def add_pending_extraction(self, extraction):
+        """
+        Keeps an extraction until it is committed or cancelled.
+
+        Returns:
+            str: The id of the extraction.
+        """
+        extraction_id = uuid.uuid4().hex
+        with self._pending_extractions_lock:
+            self._pending_extractions[extraction_id] = extraction
+            while len(self._pending_extractions) > config.SERVER_MAX_PENDING_EXTRACTIONS:
+                self._pending_extractions.popitem(last=False)
+        return extraction_id
+
+    def get_pending_extraction(self, extraction_id):
+        """
+        Returns a pending extraction, or None if there is no pending extraction with this id.
+        """
+        with self._pending_extractions_lock:
+            return self._pending_extractions.get(extraction_id)
+
+    def pop_pending_extraction(self, extraction_id):
+        """
+        Removes a pending extraction.
+
+        Returns:
+            The extraction, or None if there is no pending extraction with this id.
+        """
+        with self._pending_extractions_lock:
+            return self._pending_extractions.pop(extraction_id, None)
+
+    def server_close(self):
+        self.batcher.close()
+        super().server_close()
+
+
+
+class RequestError(Exception):
+    """
+    Error of a request, answered with its HTTP status.
+    """
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+
+# --------------------------------------------------------------------------------
+# Class RequestHandler
+# --------------------------------------------------------------------------------
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    Handler of the requests of a `FactServer`.
+    """
+    # keep-alive connections, and chunked responses for the streamed exports
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._handle({"/metrics": self._metrics, "/health": self._health})
+
+    def do_POST(self):
+        self._handle({"/extract": self._extract, "/commit": self._commit, "/cancel": self._cancel,
+                      "/query": self._query, "/export": self._export})
+
+    def _handle(self, routes):
+        """
+        Routes a request to its endpoint, answering errors as JSON.
+
+        Note:
+            The body is read before routing, so that an error never leaves it unread on a keep-alive 
+                connection, where it would be taken for the next request.
+        """
+        route = routes.get(self.path.split("?")[0])
+        self._body = None
+        try:
+            self._body = self._read_body()
+            if route is None:
+                raise RequestError(404, f"Unknown endpoint {self.path}.")
+            route()
+        except RequestError as e:
+            self._send_json({"error": str(e)}, e.status)
+        except Exception as e:
+            logging.exception(f"Request {self.path} failed.")
+            self._send_json({"error": str(e)}, 500)
+
+    def _read_body(self):
+        """
+        Reads the body of the request, as delimited by its Content-Length.
+        """
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            # the end of the body is unknown, hence the start of the next request
+            self.close_connection = True
+            raise RequestError(400, "The Content-Length must be a non-negative integer.")
+        return self.rfile.read(length)
+
+    def _read_json(self):
+        """
+        Parses the JSON object in the body of the request.
+        """
+        try:
+            body = json.loads(self._body or b"{}")
+        except json.JSONDecodeError as e:
+            raise RequestError(400, f"Invalid JSON: {e}")
+        if not isinstance(body, dict):
+            raise RequestError(400, "The body must be a JSON object.")
+        return body
+
+    def _send(self, content, content_type, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_json(self, payload, status=200):
+        self._send(json.dumps(payload).encode("utf-8"), "application/json", status)
+
+    # --------------------------------------------------------------------------------
+    # Endpoints
+    # --------------------------------------------------------------------------------
+    def _extract(self):
+        utterance = self._read_json().get("utterance")
+        if not isinstance(utterance, str) or len(utterance.strip()) == 0:
+            raise RequestError(400, "An utterance is required.")
+
+        try:
+            result = self.server.batcher.submit(utterance).result(timeout=2 * config.GPT3_DEADLINE_SECONDS)
+        except (TimeoutError, OSError) as e:
+            raise RequestError(503, f"Could not extract facts: {e}")
+
+        extraction = self.server.engine.new_extraction(utterance)
+        extraction.fact_tuples = result["facts"]
+        self._send_json({"extraction_id": self.server.add_pending_extraction(extraction),
+                         "facts": extraction.extracted_facts(), "error": result["error"]})
+
+    def _commit(self):
+        body = self._read_json()
+        extraction = self.server.get_pending_extraction(body.get("extraction_id"))
+        if extraction is None:
+            raise RequestError(404, "No pending extraction with this id.")
+        # kept pending until committed, so that a failed commit can be retried
+        counts = extraction.commit(confirmed=bool(body.get("confirmed", False)))
+        self.server.pop_pending_extraction(body.get("extraction_id"))
+        if counts is None:
+            # committed or cancelled by a concurrent request
+            raise RequestError(404, "No pending extraction with this id.")
+        self._send_json({"committed_facts": counts["inserted"], "duplicate_facts": counts["duplicates"],
+                         "merged_facts": counts["merged"]})
+
+    def _cancel(self):
+        extraction = self.server.pop_pending_extraction(self._read_json().get("extraction_id"))
+        if extraction is None:
+            raise RequestError(404, "No pending extraction with this id.")
+        extraction.cancel()
+        self._send_json({})
+
+    def _query_results(self, body, paginated=True):
+        """
+        Queries the engine with the fields of a request body.
+        """
+        search_mode = body.get("search_mode")
+        if search_mode not in [None, "llm", "local"]:
+            raise RequestError(400, "The search mode must be \"llm\" or \"local\".")
+        fact_query = body.get("query", "")
+        if not isinstance(fact_query, str):
+            raise RequestError(400, "The query must be a string.")
+        return self.server.engine.query(fact_query,
+                                        categories=self._string_list(body, "categories"),
+                                        entry_types=self._string_list(body, "entry_types"),
+                                        people=self._string_list(body, "people"),
+                                        offset=self._non_negative_int(body, "offset", 0) if paginated else 0,
+                                        limit=self._non_negative_int(body, "limit", None) if paginated else None,
+                                        search_mode=search_mode)
+
+    @staticmethod
+    def _non_negative_int(body, field, default):
+        """
+        Returns a field of a request body that must be a non-negative integer, or its default if missing.
+        """
+        value = body.get(field)
+        if value is None:
+            return default
+        if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+            raise RequestError(400, f"The {field} must be a non-negative integer.")
+        return value
+
+    @staticmethod
+    def _string_list(body, field):
+        """
+        Returns a field of a request body that must be a list of strings, or None if missing.
+        """
+        value = body.get(field)
+        if value is None:
+            return None
+        if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+            raise RequestError(400, f"The {field} must be a list of strings.")
+        return value
+
+    def _query(self):
+        df_results = self._query_results(self._read_json())
+        df_records = df_results.astype(object).where(df_results.notna(), None)
+        facts = [{"Id": int(row_id), **record}
+                 for row_id, record in zip(df_records.index, df_records.to_dict("records"))]
+        self._send_json({"total_results": df_results.attrs["total_results"], "facts": facts})
+
+    def _export(self):
+        body = self._read_json()
+        file_type = body.get("file_type", "csv")
+        if file_type not in EXPORT_CONTENT_TYPES:
+            raise RequestError(400, f"The file type must be one of {', '.join(EXPORT_CONTENT_TYPES)}.")
+        df_results = self._query_results(body, paginated=False)
+
+        if file_type not in ["csv", "tsv"]:
+            content = self.server.engine.export_data_to_binary(df_results, file_type=file_type)
+            self._send(content.getvalue() if hasattr(content, "getvalue") else content, EXPORT_CONTENT_TYPES[file_type])
+            return
+
+        # the first rows are sent while the next ones are being encoded
+        self.send_response(200)
+        self.send_header("Content-Type", EXPORT_CONTENT_TYPES[file_type])
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for chunk in self.server.engine.export_data_chunks(df_results, file_type=file_type):
+            self.wfile.write(f"{len(chunk):X}\r\n".encode("ascii") + chunk + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _metrics(self):
+        self._send(self.server.engine.metrics.to_prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+
+    def _health(self):
+        self._send_json({"facts": self.server.engine.fact_count()})
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} - {format % args}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves the engine over HTTP/JSON.")
+    parser.add_argument("--host", default=config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT)
+    parser.add_argument("--max-batch-size", type=int, default=config.SERVER_MAX_BATCH_SIZE,
+                        help="maximum number of extraction requests coalesced into a single GPT-3 request")
+    parser.add_argument("--max-wait-ms", type=float, default=config.SERVER_MAX_WAIT_SECONDS * 1000,
+                        help="maximum time an extraction request waits for others to be batched with")
+    parser.add_argument("--storage-backend", choices=["csv", "sqlite"], default=config.STORAGE_BACKEND)
+    args = parser.parse_args()
+
+    server = FactServer((args.host, args.port), Engine(storage_backend=args.storage_backend),
+                        max_batch_size=args.max_batch_size, max_wait_seconds=args.max_wait_ms / 1000)
+    print(f"Serving on http://{args.host}:{args.port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,797 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from array import array
+import bisect
+from config import config
+import io
+from src.logger import logging
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import re
+import sqlite3
+import threading
+from types import MappingProxyType
+
+
+COLUMNS = ["Category", "Type", "People", "Key", "Value"]
+
+# columns with small vocabularies, kept dictionary-encoded in memory
+CATEGORICAL_COLUMNS = ["Category", "Type", "People"]
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """
+    Splits a text into normalized (lowercase, alphanumeric) tokens.
+
+    Parameters:
+        text (str): The text to tokenize.
+
+    Returns:
+        list: The tokens of the text, in order.
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+
+# --------------------------------------------------------------------------------
+# Class FactStorage
+# --------------------------------------------------------------------------------
+class FactStorage:
+    """
+    Interface of the storages of the facts database and of the allowed categories.
+    The engine only talks to its storage through these methods, so that backends can be swapped.
+    """
+    def insert(self, fact_tuples):
+        """
+        Inserts facts into the database.
+
+        Parameters:
+            fact_tuples (list): A list of tuples (category, type, people, key, value).
+
+        Returns:
+            list: The row ids given to the inserted facts, in order.
+        """
+        raise NotImplementedError
+
+    def save(self):
+        """
+        Persists the facts inserted since the last save.
+        """
+        raise NotImplementedError
+
+    def dataframe(self):
+        """
+        Returns the whole database.
+
+        Returns:
+            A DataFrame with the columns Category, Type, People, Key and Value.
+        """
+        raise NotImplementedError
+
+    def dataframe_chunks(self, chunk_rows):
+        """
+        Returns the whole database, a chunk at a time.
+
+        Parameters:
+            chunk_rows (int): The maximum number of rows of a chunk.
+
+        Returns:
+            An iterator over DataFrames with the columns Category, Type, People, Key and Value, indexed 
+            by row id, in row id order.
+        """
+        df = self.dataframe()
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+
+    def rows(self, row_ids):
+        """
+        Returns the facts with the specified row ids.
+
+        Parameters:
+            row_ids (list): The row ids of the facts.
+
+        Returns:
+            A DataFrame with the facts, indexed by row id, in the order of `row_ids`.
+        """
+        raise NotImplementedError
+
+    def filtered(self, categories=None, entry_types=None, people=None, offset=0, limit=None):
+        """
+        Filters the database based on the specified categories, entry types, and people,
+        compared case-insensitively.
+
+        Parameters:
+            categories (list, optional): A list of categories to filter the database. Default is None.
+            entry_types (list, optional): A list of entry types to filter the database. Default is None.
+            people (list, optional): A list of people to filter the database. Default is None.
+            offset (int, optional): The number of filtered rows to skip. Default is 0.
+            limit (int, optional): The maximum number of filtered rows to return. Default is None (all 
+                the rows).
+
+        Returns:
+            A DataFrame that contains the filtered rows between `offset` and `offset + limit`, in row id 
+            order, with the total number of filtered rows in its `attrs["total_results"]`. Only that 
+            page of rows is ever built.
+        """
+        raise NotImplementedError
+
+    def search(self, terms, categories=None, entry_types=None, people=None):
+        """
+        Searches the filtered database for the specified terms.
+
+        Parameters:
+            terms (list): The terms to search for.
+            categories (list, optional): A list of categories to filter the database. Default is None.
+            entry_types (list, optional): A list of entry types to filter the database. Default is None.
+            people (list, optional): A list of people to filter the database. Default is None.
+
+        Returns:
+            A DataFrame containing the filtered rows that match any of the terms.
+        """
+        raise NotImplementedError
+
+    def unique(self, column):
+        """
+        Returns the distinct values of a column.
+
+        Parameters:
+            column (str): One of "Category", "Type" or "People".
+
+        Returns:
+            A list of the distinct non-empty values of the column, in order of first insertion.
+        """
+        return list(self._facets[column])
+
+    def facet_counts(self, column):
+        """
+        Returns the number of facts for each distinct value of a column.
+
+        Parameters:
+            column (str): One of "Category", "Type" or "People".
+
+        Returns:
+            A read-only mapping from the distinct non-empty values of the column, in order of first 
+            insertion, to their number of facts. It is kept up to date as facts are inserted.
+        """
+        return MappingProxyType(self._facets[column])
+
+    def _count_facets(self, fact_tuples):
+        """
+        Updates the facet counts with newly inserted facts. Storages call it on every insertion,
+        after having initialized `_facets` with the counts of the facts already stored.
+
+        Parameters:
+            fact_tuples (list): A list of tuples (category, type, people, key, value).
+        """
+        for fact_tuple in fact_tuples:
+            for column in CATEGORICAL_COLUMNS:
+                value = fact_tuple[COLUMNS.index(column)]
+                if isinstance(value, str) and len(value) > 0:
+                    facets = self._facets[column]
+                    facets[value] = facets.get(value, 0) + 1
+
+    def load_categories(self):
+        """
+        Loads the allowed categories.
+
+        Returns:
+            The list of allowed categories, or None if they were never saved.
+        """
+        raise NotImplementedError
+
+    def save_categories(self, categories):
+        """
+        Saves the allowed categories, if they changed since they were last saved.
+
+        Parameters:
+            categories (list): The allowed categories.
+        """
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+
+# --------------------------------------------------------------------------------
+# Class TermIndex
+# --------------------------------------------------------------------------------
+class TermIndex:
+    """
+    Inverted index from the normalized tokens of the facts to the ids of the rows containing them.
+    Rows are added in increasing id order, so every posting list stays sorted. A sorted vocabulary
+    of the tokens lets the last token of a term match as a prefix, as in `SqliteStorage.search`.
+    """
+    def __init__(self):
+        self._postings = {}
+        # the tokens, sorted; the tokens added since it was last sorted are merged on the next lookup
+        self._vocabulary = []
+        self._new_tokens = []
+        self._vocabulary_lock = threading.Lock()
+
+    def add(self, row_id, fact_tuple):
+        """
+        Indexes the tokens of all the fields of a fact.
+
+        Parameters:
+            row_id (int): The id of the row holding the fact.
+            fact_tuple (tuple): The fact (category, type, people, key, value).
+        """
+        tokens = set()
+        for field in fact_tuple:
+            if isinstance(field, str):
+                tokens.update(tokenize(field))
+        for token in tokens:
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = array("q")
+                self._new_tokens.append(token)
+            posting.append(row_id)
+
+    def _prefix_posting(self, prefix):
+        """
+        Returns the ids of the rows containing a token starting with a prefix.
+
+        Parameters:
+            prefix (str): The prefix, a normalized token.
+
+        Returns:
+            set: The ids of the matching rows.
+        """
+        with self._vocabulary_lock:
+            if len(self._new_tokens) > 0:
+                # both runs are sorted, so the merge takes linear time
+                self._vocabulary = sorted(self._vocabulary + sorted(self._new_tokens))
+                self._new_tokens = []
+            vocabulary = self._vocabulary
+
+        row_ids = set()
+        i = bisect.bisect_left(vocabulary, prefix)
+        while i < len(vocabulary) and vocabulary[i].startswith(prefix):
+            row_ids.update(self._postings[vocabulary[i]])
+            i += 1
+        return row_ids
+
+    def lookup(self, term):
+        """
+        Finds the rows containing every token of a term, the last one possibly as a prefix.
+
+        Parameters:
+            term (str): The term to look up.
+
+        Returns:
+            set: The ids of the matching rows.
+        """
+        tokens = tokenize(term)
+        if len(tokens) == 0:
+            return set()
+        postings = [self._postings.get(token, ()) for token in set(tokens[:-1])]
+        postings.append(self._prefix_posting(tokens[-1]))
+
+        # intersect starting from the shortest posting list
+        postings.sort(key=len)
+        row_ids = set(postings[0])
+        for posting in postings[1:]:
+            if len(row_ids) == 0:
+                break
+            row_ids.intersection_update(posting)
+        return row_ids
+
+    def lookup_any(self, terms):
+        """
+        Finds the rows matching any of the terms.
+
+        Parameters:
+            terms (list): The terms to look up.
+
+        Returns:
+            list: The sorted, deduplicated ids of the matching rows.
+        """
+        row_ids = set()
+        for term in terms:
+            row_ids |= self.lookup(term)
+        return sorted(row_ids)
+
+    def __len__(self):
+        return len(self._postings)
+
+
+
+# --------------------------------------------------------------------------------
+# Class CsvStorage
+# --------------------------------------------------------------------------------
+class CsvStorage(FactStorage):
+    """
+    Storage keeping the database in memory as a DataFrame, persisted as a CSV file plus an
+    append-only journal of the facts inserted since the file was last written.
+    """
+    def __init__(self, database_file_path, categories_file_path, journal_file_path):
+        self._database_file_path = database_file_path
+        self._categories_file_path = categories_file_path
+        self._journal_file_path = journal_file_path
+
+        # what has already been persisted, so that saves only write what changed
+        self._unsaved_facts = []
+        self._journal_facts_count = 0
+        self._saved_categories = None
+
+        # facts inserted since the DataFrame was last materialized, see `database`
+        self._pending_facts = []
+
+        # built on the first search, then maintained on every insertion
+        self._term_index = None
+
+        # lowercase version of the categories of each categorical column, see `_lowercase_categories`
+        self._lowercase_categories_cache = {}
+
+        # concurrent readers may all find the DataFrame or the term index to be built
+        self._lazy_lock = threading.RLock()
+
+        # load the database or create it from scratch if needed
+        database_file_exists = True
+        try:
+            self._database = pd.read_csv(self._database_file_path)
+            logging.info(f"Loaded database from {self._database_file_path}.")
+        except FileNotFoundError:
+            self._database = pd.DataFrame(columns=COLUMNS)
+            database_file_exists = False
+
+        # replay the facts inserted since the last compaction, even if the database file is missing
+        df_journal = self._read_journal()
+        if df_journal is not None:
+            self._database = pd.concat([self._database, df_journal], ignore_index=True)
+            self._journal_facts_count = len(df_journal)
+            logging.info(f"Replayed {len(df_journal)} facts from {self._journal_file_path}.")
+
+        if not database_file_exists:
+            # the replayed facts, if any, are written to the new database file before the journal is removed
+            self._compact()
+            logging.info(f"Created database in {self._database_file_path}.")
+
+        self._facets = {}
+        for column in CATEGORICAL_COLUMNS:
+            self._database[column] = self._database[column].astype("category")
+            counts = self._database[column].value_counts(sort=False)
+            self._facets[column] = {value: int(counts[value]) for value in self._database[column].dropna().unique()
+                                    if value != ""}
+        self._facts_count = len(self._database)
+
+    def _read_journal(self):
+        """
+        Reads the journal, dropping a last record left partially written by a crash during an append.
+
+        Returns:
+            A DataFrame with the facts of the journal, or None if there is no journal.
+
+        Note:
+            Every record ends with a line break, so a journal not ending with one has a partial last 
+                record. The partial record is dropped, and cut from the file so that the next append 
+                starts on a new line. A partial record of several lines (a field with line breaks) is 
+                only detected by the parser, and dropped line by line until the rest parses.
+        """
+        try:
+            with open(self._journal_file_path, "rb") as file:
+                content = file.read()
+        except FileNotFoundError:
+            return None
+
+        valid_length = content.rfind(b"\n") + 1
+        while True:
+            try:
+                df_journal = pd.read_csv(io.BytesIO(content[:valid_length])) if valid_length > 0 else None
+                break
+            except pd.errors.EmptyDataError:
+                df_journal = None
+                break
+            except pd.errors.ParserError:
+                valid_length = content.rfind(b"\n", 0, valid_length - 1) + 1
+
+        if valid_length < len(content):
+            logging.warning(f"Dropped a partially written record of {len(content) - valid_length} bytes at the end "
+                            f"of {self._journal_file_path}.")
+            if df_journal is None:
+                os.remove(self._journal_file_path)
+            else:
+                with open(self._journal_file_path, "r+b") as file:
+                    file.truncate(valid_length)
+        return df_journal
+
+    @property
+    def database(self):
+        """
+        The whole database as a DataFrame, indexed by row id.
+
+        Note:
+            Insertions only append to a buffer, which is turned into a DataFrame and concatenated 
+                to the database with a single allocation the next time the database is read. A batch 
+                of insertions thus costs time linear in the number of facts inserted.
+            The returned DataFrame is never modified afterwards, new facts go to a new one, so that 
+                readers can keep using it as a consistent snapshot.
+        """
+        with self._lazy_lock:
+            if len(self._pending_facts) > 0:
+                database = self._database.copy(deep=False)
+                df_to_add = pd.DataFrame(self._pending_facts, columns=COLUMNS)
+                # extend the categories of the database with the new values, so that the concatenation 
+                # keeps the columns categorical (it falls back to object dtype if the categories differ)
+                for column in CATEGORICAL_COLUMNS:
+                    categories = database[column].cat.categories
+                    new_categories = pd.Index(df_to_add[column].dropna().unique()).difference(categories)
+                    if len(new_categories) > 0:
+                        database[column] = database[column].cat.add_categories(new_categories)
+                    df_to_add[column] = pd.Categorical(df_to_add[column], 
+                                                       categories=database[column].cat.categories)
+                self._database = pd.concat([database, df_to_add], ignore_index=True)
+                self._pending_facts = []
+            return self._database
+
+    def insert(self, fact_tuples):
+        fact_tuples = [tuple(fact_tuple) for fact_tuple in fact_tuples]
+        # row ids are the positions of the facts in the DataFrame
+        row_ids = list(range(self._facts_count, self._facts_count + len(fact_tuples)))
+        if self._term_index is not None:
+            for row_id, fact_tuple in zip(row_ids, fact_tuples):
+                self._term_index.add(row_id, fact_tuple)
+
+        self._count_facets(fact_tuples)
+        self._pending_facts += fact_tuples
+        self._unsaved_facts += fact_tuples
+        self._facts_count += len(fact_tuples)
+        logging.debug(f"Inserted {len(fact_tuples)} facts, database has {self._facts_count} facts.")
+        return row_ids
+
+    def save(self):
+        """
+        Persists the facts inserted since the last save.
+
+        Note:
+            Only the new facts are written, appended to the journal file. Once the journal grows
+                large compared to the database file, both are compacted into a new database file.
+        """
+        if len(self._unsaved_facts) == 0:
+            return
+
+        new_facts = pd.DataFrame(self._unsaved_facts, columns=COLUMNS)
+        # every record ends with a line break, which tells a partially written last record, see `_read_journal`
+        new_facts.to_csv(self._journal_file_path, mode="a", index=False, lineterminator="\n",
+                         header=not os.path.exists(self._journal_file_path))
+        self._unsaved_facts = []
+        self._journal_facts_count += len(new_facts)
+        logging.debug(f"Appended {len(new_facts)} facts to {self._journal_file_path}.")
+
+        snapshot_facts_count = self._facts_count - self._journal_facts_count
+        if self._journal_facts_count >= max(config.JOURNAL_COMPACTION_MIN_FACTS,
+                                            config.JOURNAL_COMPACTION_RATIO * snapshot_facts_count):
+            self._compact()
+
+    def _compact(self):
+        """
+        Writes the whole database to the database file and empties the journal.
+
+        Note:
+            The database file is replaced atomically. Should the process stop before the journal is
+                removed, its facts would be replayed twice on the next startup, but none would be lost.
+        """
+        temporary_file_path = f"{self._database_file_path}.tmp"
+        self.database.to_csv(temporary_file_path, index=False)
+        os.replace(temporary_file_path, self._database_file_path)
+        if os.path.exists(self._journal_file_path):
+            os.remove(self._journal_file_path)
+
+        self._unsaved_facts = []
+        self._journal_facts_count = 0
+        logging.info(f"Saved database with {len(self.database)} facts in {self._database_file_path}.")
+
+    def dataframe(self):
+        return self.database
+
+    def rows(self, row_ids):
+        return self.database.iloc[list(row_ids)]
+
+    def filtered(self, categories=None, entry_types=None, people=None, offset=0, limit=None):
+        database = self.database
+        end = None if limit is None else offset + limit
+        mask = self._filter_mask(database, categories, entry_types, people)
+        if mask is None:
+            total_results = len(database)
+            df = database.iloc[offset:end]
+        else:
+            positions = np.flatnonzero(mask)
+            total_results = len(positions)
+            df = database.iloc[positions[offset:end]]
+        df.attrs["total_results"] = total_results
+        return df
+
+    def _filter(self, df, categories=None, entry_types=None, people=None):
+        """
+        Filters a DataFrame based on the specified categories, entry types, and people.
+
+        Returns:
+            A DataFrame that contains the filtered rows of `df`.
+        """
+        mask = self._filter_mask(df, categories, entry_types, people)
+        return df if mask is None else df[mask]
+
+    def _filter_mask(self, df, categories=None, entry_types=None, people=None):
+        """
+        Computes which rows of a DataFrame pass a filter on the specified categories, entry types, 
+        and people.
+
+        Returns:
+            A boolean NumPy array with an element per row of `df`, or None if there is no filter.
+
+        Note:
+            Values are compared through the codes of the categorical columns, so that only the 
+                categories, not every row, need to be lowercased.
+        """
+        mask = None
+        for column, values in [("Category", categories), ("Type", entry_types), ("People", people)]:
+            if values is not None and len(values) > 0:
+                wanted_values = [v.lower() for v in values]
+                wanted_codes = np.flatnonzero(np.isin(self._lowercase_categories(column), wanted_values))
+                column_mask = np.isin(df[column].cat.codes.to_numpy(), wanted_codes)
+                mask = column_mask if mask is None else mask & column_mask
+        return mask
+
+    def _lowercase_categories(self, column):
+        """
+        Returns the lowercase categories of a categorical column, indexed by code.
+
+        Parameters:
+            column (str): One of the categorical columns.
+
+        Returns:
+            A NumPy array with the lowercase version of each category of the column.
+        """
+        categories = self.database[column].cat.categories
+        # categories are only ever appended, so their number identifies the cached version
+        cached = self._lowercase_categories_cache.get(column)
+        if cached is None or len(cached) != len(categories):
+            cached = np.array([str(category).lower() for category in categories], dtype=object)
+            self._lowercase_categories_cache[column] = cached
+        return cached
+
+    def search(self, terms, categories=None, entry_types=None, people=None):
+        """
+        Searches the filtered database for the specified terms.
+
+        Note:
+            A fact matches a term if any of its fields contain all the tokens of the term, the last
+                one possibly as a prefix. Matches are looked up in the term index, so only the matching rows are ever filtered, and 
+                each row is returned once.
+        """
+        if len(terms) == 0:
+            return self.filtered(categories, entry_types, people)
+
+        row_ids = self.term_index().lookup_any(terms)
+        return self._filter(self.database.iloc[row_ids], categories, entry_types, people)
+
+    def term_index(self):
+        """
+        Returns the term index of the database, building it if needed.
+
+        Returns:
+            TermIndex: The inverted index of the tokens of the facts.
+        """
+        with self._lazy_lock:
+            if self._term_index is None:
+                term_index = TermIndex()
+                for row_id, fact_tuple in enumerate(self.database.itertuples(index=False, name=None)):
+                    term_index.add(row_id, fact_tuple)
+                self._term_index = term_index
+                logging.info(f"Built term index with {len(self._term_index)} tokens over {len(self.database)} facts.")
+            return self._term_index
+
+    def load_categories(self):
+        try:
+            df_categories = pd.read_csv(self._categories_file_path)
+        except FileNotFoundError:
+            return None
+        self._saved_categories = df_categories["Category"].tolist()
+        logging.info(f"Loaded categories {self._saved_categories} from {self._categories_file_path}.")
+        return list(self._saved_categories)
+
+    def save_categories(self, categories):
+        if categories == self._saved_categories:
+            return
+        pd.DataFrame(categories, columns=["Category"]).to_csv(self._categories_file_path, index=False)
+        self._saved_categories = list(categories)
+        logging.info(f"Saved allowed categories {categories} in {self._categories_file_path}.")
+
+    def __len__(self):
+        return self._facts_count
+
+
+
+# --------------------------------------------------------------------------------
+# Class SqliteStorage
+# --------------------------------------------------------------------------------
+class SqliteStorage(FactStorage):
+    """
+    Storage keeping the database in a SQLite file. Category, Type and People are indexed and
+    compared case-insensitively, and Key and Value are indexed by a FTS5 full-text table, so that
+    filters and searches do not need to load or scan the whole database.
+    """
+    def __init__(self, database_file_path):
+        self._database_file_path = database_file_path
+        self._saved_categories = None
+
+        # Streamlit serves each session from its own thread
+        self._lock = threading.Lock()
+
+        os.makedirs(Path(database_file_path).parent, exist_ok=True)
+        self._connection = sqlite3.connect(str(database_file_path), check_same_thread=False)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS facts (
+                id INTEGER PRIMARY KEY,
+                "Category" TEXT COLLATE NOCASE,
+                "Type" TEXT COLLATE NOCASE,
+                "People" TEXT COLLATE NOCASE,
+                "Key" TEXT,
+                "Value" TEXT);
+            CREATE INDEX IF NOT EXISTS facts_category ON facts ("Category");
+            CREATE INDEX IF NOT EXISTS facts_type ON facts ("Type");
+            CREATE INDEX IF NOT EXISTS facts_people ON facts ("People");
+
+            CREATE VIRTUAL TABLE IF NOT EXISTS facts_fts USING fts5(
+                "Key", "Value", content='facts', content_rowid='id');
+            CREATE TRIGGER IF NOT EXISTS facts_fts_insert AFTER INSERT ON facts BEGIN
+                INSERT INTO facts_fts (rowid, "Key", "Value") VALUES (new.id, new."Key", new."Value");
+            END;
+
+            CREATE TABLE IF NOT EXISTS categories (
+                position INTEGER PRIMARY KEY,
+                "Category" TEXT);
+        """)
+        self._connection.commit()
+
+        self._facets = {}
+        for column in CATEGORICAL_COLUMNS:
+            rows = self._connection.execute(f'SELECT "{column}", COUNT(*) FROM facts WHERE "{column}" <> \'\' '
+                                            f'GROUP BY "{column}" COLLATE BINARY ORDER BY MIN(id)').fetchall()
+            self._facets[column] = dict(rows)
+        logging.info(f"Opened database in {self._database_file_path} with {len(self)} facts.")
+
+    def insert(self, fact_tuples):
+        with self._lock:
+            # ids are given in sequence after the largest one, and insertions are serialized by the lock
+            last_id = self._connection.execute("SELECT COALESCE(MAX(id), 0) FROM facts").fetchone()[0]
+            self._connection.executemany('INSERT INTO facts ("Category", "Type", "People", "Key", "Value") '
+                                         'VALUES (?, ?, ?, ?, ?)', [tuple(fact_tuple) for fact_tuple in fact_tuples])
+            self._connection.commit()
+            self._count_facets(fact_tuples)
+        logging.debug(f"Inserted {len(fact_tuples)} facts in {self._database_file_path}.")
+        return list(range(last_id + 1, last_id + 1 + len(fact_tuples)))
+
+    def save(self):
+        # every insertion is committed as its own transaction
+        pass
+
+    def _select(self, where_clauses=(), parameters=(), offset=0, limit=None):
+        """
+        Runs a SELECT over the facts table.
+
+        Parameters:
+            where_clauses (list, optional): SQL conditions, combined with AND. Default is no condition.
+            parameters (list, optional): The values bound to the conditions. Default is no value.
+            offset (int, optional): The number of matching facts to skip. Default is 0.
+            limit (int, optional): The maximum number of facts to return. Default is None (all of them).
+
+        Returns:
+            A DataFrame with the matching facts, indexed by their id.
+        """
+        sql = 'SELECT id, "Category", "Type", "People", "Key", "Value" FROM facts'
+        parameters = list(parameters)
+        if len(where_clauses) > 0:
+            sql += " WHERE " + " AND ".join(where_clauses)
+        sql += " ORDER BY id"
+        if offset > 0 or limit is not None:
+            # a negative limit means no limit in SQLite
+            sql += " LIMIT ? OFFSET ?"
+            parameters += [-1 if limit is None else limit, offset]
+
+        with self._lock:
+            rows = self._connection.execute(sql, parameters).fetchall()
+        return pd.DataFrame([row[1:] for row in rows], columns=COLUMNS,
+                            index=pd.Index([row[0] for row in rows], dtype="int64"))
+
+    def rows(self, row_ids):
+        row_ids = [int(row_id) for row_id in row_ids]
+        df_rows = [self._select([f"id IN ({', '.join('?' * len(chunk))})"], chunk) 
+                   for chunk in [row_ids[i:i + 500] for i in range(0, len(row_ids), 500)]]
+        if len(df_rows) == 0:
+            return self._select(["0"])
+        return pd.concat(df_rows).loc[row_ids]
+
+    def _filter_clauses(self, categories=None, entry_types=None, people=None):
+        """
+        Builds the SQL conditions of a filter.
+
+        Returns:
+            A tuple (where_clauses, parameters).
+        """
+        where_clauses = []
+        parameters = []
+        for column, values in [("Category", categories), ("Type", entry_types), ("People", people)]:
+            if values is not None and len(values) > 0:
+                where_clauses.append(f'"{column}" IN ({", ".join("?" * len(values))})')
+                parameters += list(values)
+        return where_clauses, parameters
+
+    def dataframe(self):
+        return self._select()
+
+    def dataframe_chunks(self, chunk_rows):
+        # a query per chunk, so that other queries get the connection in between
+        last_id = 0
+        while True:
+            df = self._select(["id > ?"], [last_id], limit=chunk_rows)
+            if len(df) == 0:
+                return
+            yield df
+            last_id = int(df.index[-1])
+
+    def filtered(self, categories=None, entry_types=None, people=None, offset=0, limit=None):
+        where_clauses, parameters = self._filter_clauses(categories, entry_types, people)
+        df = self._select(where_clauses, parameters, offset, limit)
+        if offset == 0 and (limit is None or len(df) < limit):
+            total_results = len(df)
+        else:
+            sql = "SELECT COUNT(*) FROM facts"
+            if len(where_clauses) > 0:
+                sql += " WHERE " + " AND ".join(where_clauses)
+            with self._lock:
+                total_results = self._connection.execute(sql, parameters).fetchone()[0]
+        df.attrs["total_results"] = total_results
+        return df
+
+    def search(self, terms, categories=None, entry_types=None, people=None):
+        """
+        Searches the filtered database for the specified terms.
+
+        Note:
+            A fact matches a term if its Key or Value contain the words of the term (the last one
+                possibly as a prefix), or if its Category, Type or People are equal to the term.
+        """
+        terms = [term for term in terms if len(term.strip()) > 0]
+        if len(terms) == 0:
+            return self.filtered(categories, entry_types, people)
+
+        # each term is a FTS5 phrase, with the quotes it contains doubled
+        fts_query = " OR ".join('"' + term.replace('"', '""') + '"*' for term in terms)
+        placeholders = ", ".join("?" * len(terms))
+        where_clauses, parameters = self._filter_clauses(categories, entry_types, people)
+        where_clauses.append(f"""(id IN (SELECT rowid FROM facts_fts WHERE facts_fts MATCH ?)
+                                  OR "Category" IN ({placeholders})
+                                  OR "Type" IN ({placeholders})
+                                  OR "People" IN ({placeholders}))""")
+        parameters += [fts_query] + terms * 3
+        return self._select(where_clauses, parameters)
+
+    def load_categories(self):
+        with self._lock:
+            rows = self._connection.execute('SELECT "Category" FROM categories ORDER BY position').fetchall()
+        if len(rows) == 0:
+            return None
+        self._saved_categories = [row[0] for row in rows]
+        logging.info(f"Loaded categories {self._saved_categories} from {self._database_file_path}.")
+        return list(self._saved_categories)
+
+    def save_categories(self, categories):
+        if categories == self._saved_categories:
+            return
+        with self._lock:
+            self._connection.execute("DELETE FROM categories")
+            self._connection.executemany('INSERT INTO categories VALUES (?, ?)', list(enumerate(categories)))
+            self._connection.commit()
+        self._saved_categories = list(categories)
+        logging.info(f"Saved allowed categories {categories} in {self._database_file_path}.")
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM facts").fetchone()[0]
@@ -0,0 +1,211 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from src.logger import logging
+import numpy as np
+from pathlib import Path
+
+
+NGRAM_SIZES = (3, 4)
+HASH_PRIME = np.uint64(1_000_003)
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def vectorize(texts, dimensions):
+    """
+    Embeds texts as hashed character n-gram vectors, with sublinear term frequencies.
+
+    Parameters:
+        texts (list): The texts to embed.
+        dimensions (int): The number of dimensions (hash buckets) of the vectors.
+
+    Returns:
+        A NumPy float32 array of shape (len(texts), dimensions), with L2-normalized rows.
+
+    Note:
+        The n-grams of all the texts are hashed at once with NumPy, so that embedding a batch
+            does not loop over its characters in Python. The hash is stable across processes.
+    """
+    vectors = np.zeros((len(texts), dimensions), dtype=np.float32)
+    if len(texts) == 0:
+        return vectors
+
+    encoded_texts = [f" {text.lower()} ".encode("utf-8") for text in texts]
+    lengths = np.array([len(encoded_text) for encoded_text in encoded_texts], dtype=np.int64)
+    ends = np.cumsum(lengths)
+    buffer = np.frombuffer(b"".join(encoded_texts), dtype=np.uint8).astype(np.uint64)
+    text_of_position = np.repeat(np.arange(len(texts)), lengths)
+    positions = np.arange(len(buffer))
+
+    counts = np.zeros(len(texts) * dimensions, dtype=np.float64)
+    for n in NGRAM_SIZES:
+        if len(buffer) < n:
+            continue
+        # polynomial hash of the n-gram starting at each position, wrapping around 2^64
+        hashes = np.zeros(len(buffer) - n + 1, dtype=np.uint64)
+        for offset in range(n):
+            hashes = hashes * HASH_PRIME + buffer[offset:len(buffer) - n + 1 + offset]
+
+        # only keep the n-grams that do not cross the end of their text
+        texts_of_ngrams = text_of_position[:len(hashes)]
+        valid = positions[:len(hashes)] + n <= ends[texts_of_ngrams]
+        buckets = ((hashes[valid] * HASH_MULTIPLIER) >> np.uint64(32)) % np.uint64(dimensions)
+        counts += np.bincount(texts_of_ngrams[valid] * dimensions + buckets.astype(np.int64),
+                              minlength=len(counts))
+
+    vectors[:] = np.log1p(counts).reshape(len(texts), dimensions)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+
+# --------------------------------------------------------------------------------
+# Class VectorIndex
+# --------------------------------------------------------------------------------
+class VectorIndex:
+    """
+    Local semantic index of the facts, as a matrix of hashed character n-gram vectors kept in
+    memory and appended to a file next to the database. Queries are weighted by inverse document
+    frequency and scored against all the facts with a single matrix-vector product.
+    """
+    def __init__(self, file_path, dimensions):
+        self._file_path = file_path
+        self._dimensions = dimensions
+        self._record_dtype = np.dtype([("id", "<i8"), ("vector", "<f4", (dimensions,))])
+
+        # growable buffers, of which only the first `_count` rows are used
+        self._count = 0
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._vectors = np.zeros((0, dimensions), dtype=np.float32)
+        self._document_frequencies = np.zeros(dimensions, dtype=np.int64)
+
+        try:
+            records = np.fromfile(self._file_path, dtype=np.uint8)
+        except FileNotFoundError:
+            records = None
+
+        if records is not None:
+            # ignore a partially written last record
+            records = records[:len(records) - len(records) % self._record_dtype.itemsize].view(self._record_dtype)
+            self._append(records["id"], records["vector"])
+            logging.info(f"Loaded {self._count} fact vectors from {self._file_path}.")
+
+    def _append(self, ids, vectors):
+        """
+        Appends vectors to the in-memory buffers, growing them geometrically if needed.
+
+        Parameters:
+            ids (numpy.ndarray): The row ids of the facts.
+            vectors (numpy.ndarray): The vectors of the facts.
+        """
+        required_capacity = self._count + len(ids)
+        if required_capacity > len(self._ids):
+            capacity = max(required_capacity, 2 * len(self._ids), 1024)
+            self._ids = np.resize(self._ids, capacity)
+            grown_vectors = np.zeros((capacity, self._dimensions), dtype=np.float32)
+            grown_vectors[:self._count] = self._vectors[:self._count]
+            self._vectors = grown_vectors
+
+        self._ids[self._count:required_capacity] = ids
+        self._vectors[self._count:required_capacity] = vectors
+        self._document_frequencies += np.count_nonzero(vectors, axis=0)
+        self._count = required_capacity
+
+    def add(self, row_ids, texts):
+        """
+        Embeds and indexes new facts, appending their vectors to the index file.
+
+        Parameters:
+            row_ids (list): The row ids of the facts in the database.
+            texts (list): The texts of the facts.
+        """
+        if len(row_ids) == 0:
+            return
+        records = np.zeros(len(row_ids), dtype=self._record_dtype)
+        records["id"] = row_ids
+        records["vector"] = vectorize(texts, self._dimensions)
+
+        os.makedirs(Path(self._file_path).parent, exist_ok=True)
+        with open(self._file_path, "ab") as file:
+            file.write(records.tobytes())
+        self._append(records["id"], records["vector"])
+
+    def clear(self):
+        """
+        Removes all the facts from the index and its file.
+        """
+        self._count = 0
+        self._document_frequencies[:] = 0
+        if os.path.exists(self._file_path):
+            os.remove(self._file_path)
+
+    def first_id(self):
+        """
+        Returns the row id of the first indexed fact.
+
+        Returns:
+            The first row id, or None if the index is empty.
+        """
+        return int(self._ids[0]) if self._count > 0 else None
+
+    def last_id(self):
+        """
+        Returns the row id of the last indexed fact.
+
+        Returns:
+            The last row id, or None if the index is empty.
+        """
+        return int(self._ids[self._count - 1]) if self._count > 0 else None
+
+    def matches(self, row_ids, texts):
+        """
+        Checks that indexed facts have the vectors of the specified texts, e.g., to tell whether the
+        index was built from a given database.
+
+        Parameters:
+            row_ids (list): The row ids of indexed facts.
+            texts (list): The texts the facts are expected to have.
+
+        Returns:
+            bool: True if every row id is indexed, with the vector of its text.
+        """
+        ids = self._ids[:self._count]
+        positions = np.searchsorted(ids, row_ids)
+        if np.any(positions >= self._count) or not np.array_equal(ids[np.minimum(positions, self._count - 1)], row_ids):
+            return False
+        return np.allclose(self._vectors[positions], vectorize(texts, self._dimensions), atol=1e-6)
+
+    def search(self, query, min_similarity=0.0, allowed_ids=None):
+        """
+        Scores all the indexed facts against a query.
+
+        Parameters:
+            query (str): The query text.
+            min_similarity (float, optional): The minimum similarity of the returned facts. Default is 0.
+            allowed_ids (array-like, optional): If specified, only these row ids are considered.
+                Default is None.
+
+        Returns:
+            tuple: The row ids of the matching facts, sorted by decreasing similarity (ties keep the
+                insertion order), and their similarities.
+        """
+        idf = np.log((1 + self._count) / (1 + self._document_frequencies)).astype(np.float32) + 1
+        query_vector = vectorize([query], self._dimensions)[0] * idf
+        norm = np.linalg.norm(query_vector)
+        if norm == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        ids = self._ids[:self._count]
+        similarities = self._vectors[:self._count] @ (query_vector / norm)
+        matches = similarities >= min_similarity
+        if allowed_ids is not None:
+            matches &= np.isin(ids, allowed_ids)
+
+        matching_positions = np.flatnonzero(matches)
+        order = np.argsort(-similarities[matching_positions], kind="stable")
+        return ids[matching_positions[order]], similarities[matching_positions[order]]
+
+    def __len__(self):
+        return self._count